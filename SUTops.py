@@ -11,49 +11,706 @@ Scope: MSc research Modelling circular economy policies in EEIOA
 @institution:Leiden University CML, TU Delft TPM
 """
 import numpy as np
-from numpy import linalg as ln
+import scipy.sparse as sp
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse.linalg import splu, gmres, bicgstab, LinearOperator
+import warnings as warn
 
 
 class SUTops:
     
+    class diag:
+        """
+        Diagonal matrix kept as the vector of its main diagonal
+        
+        diag(x) @ M scales the rows of M and M @ diag(x) scales its columns,
+        so the dense n x n matrix is never built (see toarray)
+        """
+        __array_ufunc__ = None # let numpy defer ndarray @ diag to __rmatmul__
+        
+        def __init__(self, x):
+            if isinstance(x, SUTops.diag):
+                x = x.x
+            elif np.ndim(x) == 2 and np.shape(x)[0] == np.shape(x)[1] != 1:
+                x = np.diagonal(np.asarray(x)) # dense diagonal matrix
+            self.x = np.asarray(x, dtype = float).reshape(-1)
+        
+        def __len__(self):
+            return(len(self.x))
+        
+        def inv(self):
+            """
+            Returns the inverse by dividing 1 by the diagonal
+            and setting inf and nan values to 0
+            """
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                x = 1/self.x
+            x[~np.isfinite(x)] = 0
+            
+            return(SUTops.diag(x))
+            
+        def rows(self, M):
+            """
+            diag(x) @ M
+            """
+            if sp.issparse(M):
+                return(sp.diags(self.x) @ M)
+            elif hasattr(M, "mul"):
+                return(M.mul(self.x, axis = 0))
+            
+            x = self.x if np.ndim(M) == 1 else self.x.reshape(-1, 1)
+            return(np.multiply(M, x))
+        
+        def cols(self, M):
+            """
+            M @ diag(x)
+            """
+            if sp.issparse(M):
+                return(M @ sp.diags(self.x))
+            elif hasattr(M, "mul"):
+                return(M.mul(self.x, axis = 1))
+            
+            return(np.multiply(M, self.x))
+        
+        def toarray(self):
+            """
+            Dense diagonal matrix
+            """
+            return(np.diag(self.x))
+        
+        def __matmul__(self, M):
+            if isinstance(M, SUTops.diag):
+                return(SUTops.diag(self.x * M.x))
+            return(self.rows(M))
+        
+        def __rmatmul__(self, M):
+            return(self.cols(M))
+    
+    
+    class leontief:
+        """
+        Leontief system (I-A) factorized once (LU)
+        
+        solve(y) = L @ y and solve_T(x) = L.T @ x work on the factors,
+        y and x can be vectors or matrices (one right-hand side per column)
+        the inverse L = (I-A)^-1 is only built when asked for (inv)
+        sparse A are factorized with sparse LU (splu)
+        
+        dtype = np.float32, the factors are stored in float32 and each
+                solve is refined in float64 against the float64 A (see
+                refine_) until the relative residual is below tol or 
+                after max_iter steps
+        lu = (lu, piv) factors of the dense I-A from a previous leontief
+             (see factors), A is then not factorized again
+        """
+        __array_ufunc__ = None # let numpy defer ndarray @ leontief
+        
+        def __init__(self, A, dtype = np.float64, tol = 1e-12, max_iter = 10, lu = None):
+            self.sparse = sp.issparse(A)
+            self.n = A.shape[0]
+            self.dtype = np.dtype(dtype)
+            self.tol = tol
+            self.max_iter = max_iter
+            # A is kept in float64 for the residuals, only the factors
+            # are in dtype
+            if self.sparse:
+                A = A.astype(float).tocsc()
+                I = sp.identity(self.n, dtype = self.dtype, format = "csc")
+                self.lu = splu(I - A.astype(self.dtype))
+            else:
+                A = np.asarray(A, dtype = float)
+                if lu is None:
+                    lu = lu_factor(np.identity(self.n, dtype = self.dtype) - A.astype(self.dtype))
+                self.lu = lu
+            self.A = A
+            self.L = None
+            self.residual = 0.0 # of the last refined solve
+            self.iterations = 0
+        
+        def __len__(self):
+            return(self.n)
+        
+        def factors(self):
+            """
+            (lu, piv) of a dense system, None for sparse ones
+            """
+            return(None if self.sparse else self.lu)
+        
+        def solve_(self, y, trans = 0):
+            """
+            Solve with the factors in their own precision
+            """
+            y = y.astype(self.dtype)
+            if self.sparse:
+                x = self.lu.solve(y, trans = "T" if trans else "N")
+            else:
+                x = lu_solve(self.lu, y, trans = trans)
+            
+            return(x.astype(float))
+        
+        def refine_(self, y, trans = 0):
+            """
+            Iterative refinement in float64 of a low precision solve
+            x = x + solve_(y - (I-A) * x)
+            """
+            A = self.A.T if trans else self.A
+            norm = max(np.abs(y).max(), np.finfo(float).tiny) if y.size else 1.0
+            
+            x = self.solve_(y, trans)
+            for i in range(self.max_iter):
+                r = y - x + A @ x
+                self.residual = np.abs(r).max() / norm
+                self.iterations = i
+                if self.residual <= self.tol:
+                    break
+                x += self.solve_(r, trans)
+            
+            return(x)
+        
+        def solve(self, y):
+            """
+            q = (I-A)^-1 * y
+            """
+            y = np.asarray(y, dtype = float)
+            if self.dtype != np.float64:
+                q = self.refine_(y)
+            elif self.sparse:
+                q = self.lu.solve(y)
+            else:
+                q = lu_solve(self.lu, y)
+            
+            return(q)
+        
+        def solve_T(self, x):
+            """
+            m = ((I-A)^-1)' * x
+            e.g. multipliers r * L are solve_T(r')'
+            """
+            x = np.asarray(x, dtype = float)
+            if self.dtype != np.float64:
+                m = self.refine_(x, 1)
+            elif self.sparse:
+                m = self.lu.solve(x, trans = "T")
+            else:
+                m = lu_solve(self.lu, x, trans = 1)
+            
+            return(m)
+        
+        def inv(self):
+            """
+            Leontief inverse
+            L = (I-A)^-1 (built once on demand)
+            """
+            if self.L is None:
+                self.L = self.solve(np.identity(self.n))
+            
+            return(self.L)
+        
+        def __matmul__(self, y):
+            return(self.solve(y))
+        
+        def diff_(self, A_, rtol):
+            """
+            dA = A_ - A without the changes below rtol, the rows and the 
+            columns it changes, sparse (csr) for sparse systems so that
+            only the entries of A and A_ are compared
+            """
+            rtol = max(rtol, np.finfo(self.dtype).eps)
+            
+            if self.sparse:
+                dA = (SUTops.sparse(A_) - self.A).tocoo()
+                A = np.asarray(self.A[dA.row, dA.col]).ravel()
+                keep = np.abs(dA.data) > rtol * np.abs(A)
+                i, j = dA.row[keep], dA.col[keep]
+                dA = sp.csr_matrix((dA.data[keep], (i, j)), shape = dA.shape)
+                rows, cols = np.unique(i), np.unique(j)
+            else:
+                dA = np.asarray(A_, dtype = float) - self.A
+                dA[np.abs(dA) <= rtol * np.abs(self.A)] = 0
+                rows = np.flatnonzero(np.any(dA != 0, axis = 1))
+                cols = np.flatnonzero(np.any(dA != 0, axis = 0))
+            
+            return(dA, rows, cols)
+        
+        def update(self, A_, rank = None, rtol = 1e-12):
+            """
+            Leontief system of A_ built from these factors when A_ - A 
+            is non-zero only in a few (k) rows or columns (woodbury)
+            
+            rank = largest k for which the update is used (default n/4),
+                   beyond it A_ is factorized from scratch
+            rtol = relative changes below it are rounding, not policies
+                   (at least the precision of dtype)
+            """
+            dA, rows, cols = self.diff_(A_, rtol)
+            
+            if rank is None:
+                rank = self.n // 4
+            
+            if min(len(rows), len(cols)) > rank:
+                A_ = SUTops.sparse(A_) if self.sparse else np.asarray(A_, dtype = float)
+                return(SUTops.leontief(A_, self.dtype, self.tol, self.max_iter))
+            
+            # dA = U * V with U (n x k) and V (k x n)
+            if len(rows) <= len(cols):
+                U = np.identity(self.n)[:, rows]
+                V = dA[rows]
+            else:
+                U = dA[:, cols]
+                V = np.identity(self.n)[cols]
+            
+            if self.sparse: # the block of dA
+                U, V = [M.toarray() if sp.issparse(M) else M for M in [U, V]]
+            
+            return(SUTops.woodbury(self, U, V))
+        
+        def solve_many(self, As, Y, rank = None, rtol = 1e-12):
+            """
+            q_c = (I-A_c)^-1 * y_c for many A_c close to A (one per column
+            of Y) with these factors, the rows (or columns) changed in any
+            A_c are shared so the baseline solves are stacked:
+            
+            rows: W = L * U once, q_c = z_c + W * inv(I - V_c * W) * V_c * z_c
+            cols: [L * U_1 .. L * U_m] in one solve, V = I[cols]
+            
+            with z = L * Y, beyond rank (default n/4) changed rows and
+            columns each A_c is factorized from scratch
+            """
+            Y = np.asarray(Y, dtype = float).reshape(self.n, -1)
+            
+            diffs = [self.diff_(A_, rtol) for A_ in As]
+            dAs = [d[0] for d in diffs]
+            rows = np.unique(np.concatenate([d[1] for d in diffs])).astype(int) if diffs else []
+            cols = np.unique(np.concatenate([d[2] for d in diffs])).astype(int) if diffs else []
+            
+            if rank is None:
+                rank = self.n // 4
+            
+            if min(len(rows), len(cols)) > rank:
+                Q = [SUTops.leontief(SUTops.sparse(A_) if self.sparse else np.asarray(A_, dtype = float), self.dtype, self.tol, self.max_iter).solve(Y[:, c])
+                     for c, A_ in enumerate(As)]
+                return(np.column_stack(Q))
+            
+            Z = self.solve(Y)
+            k = min(len(rows), len(cols))
+            if k == 0:
+                return(Z)
+            
+            Q = np.empty(Z.shape)
+            I = np.identity(k)
+            if len(rows) <= len(cols):
+                W = self.solve(np.identity(self.n)[:, rows])
+                for c, dA in enumerate(dAs):
+                    V = dA[rows]
+                    Vz = V @ Z[:, c]
+                    Q[:, c] = Z[:, c] + W @ np.linalg.solve(I - V @ W, Vz)
+            else:
+                dense = lambda M: M.toarray() if sp.issparse(M) else M
+                Ws = self.solve(np.hstack([dense(dA[:, cols]) for dA in dAs]))
+                for c in range(len(dAs)):
+                    W = Ws[:, c * k:(c + 1) * k]
+                    Q[:, c] = Z[:, c] + W @ np.linalg.solve(I - W[cols], Z[cols, c])
+            
+            return(Q)
+    
+    
+    class woodbury:
+        """
+        Leontief system of a low-rank change A_ = A + U * V
+        solved with the factors of the baseline leontief system
+        
+        (I-A_)^-1 = L + L * U * inv(I - V * L * U) * V * L
+        
+        each solve costs one baseline solve plus O(n*k)
+        """
+        __array_ufunc__ = None
+        
+        def __init__(self, base, U, V):
+            self.base = base
+            self.n = base.n
+            self.U = U
+            self.V = V
+            self.W = base.solve(U) # L * U
+            self.K = lu_factor(np.identity(U.shape[1]) - V @ self.W)
+            self.Wt = None
+            self.L = None
+        
+        def __len__(self):
+            return(self.n)
+        
+        def solve(self, y):
+            """
+            q = (I-A_)^-1 * y
+            """
+            z = self.base.solve(y)
+            q = z + self.W @ lu_solve(self.K, self.V @ z)
+            
+            return(q)
+        
+        def solve_T(self, x):
+            """
+            m = ((I-A_)^-1)' * x
+            """
+            if self.Wt is None:
+                self.Wt = self.base.solve_T(self.V.T) # L' * V'
+            
+            z = self.base.solve_T(x)
+            m = z + self.Wt @ lu_solve(self.K, self.U.T @ z, trans = 1)
+            
+            return(m)
+        
+        def inv(self):
+            """
+            Leontief inverse
+            L_ = (I-A_)^-1 (built once on demand)
+            """
+            if self.L is None:
+                L = self.base.inv()
+                self.L = L + self.W @ lu_solve(self.K, self.V @ L)
+            
+            return(self.L)
+        
+        def __matmul__(self, y):
+            return(self.solve(y))
+    
+    class iterative:
+        """
+        Leontief system solved iteratively, I-A is never factorized
+        
+        method = "gmres" or "bicgstab", Krylov solvers of (I-A) * q = y
+                 "series", q = y + A * y + A^2 * y + ..., converges as A
+                 is nonnegative with column sums a < 1, the terms left
+                 after A^k * y are bounded by a/(1-a) * |A^k * y|
+        tol = relative tolerance of q
+        M = preconditioner of the Krylov solvers, e.g. the baseline 
+            leontief system (M.solve and M.solve_T)
+        x0 = warm start, e.g. the baseline q
+        """
+        __array_ufunc__ = None
+        
+        methods = ["gmres", "bicgstab", "series"]
+        
+        def __init__(self, A, method = "gmres", tol = 1e-10, max_iter = 1000, M = None, x0 = None):
+            if method not in self.methods:
+                raise KeyError("Only the following iterative methods are allowed =>" + str(self.methods))
+            
+            self.A = A.tocsr() if sp.issparse(A) else np.asarray(A, dtype = float)
+            self.n = self.A.shape[0]
+            self.method = method
+            self.tol = tol
+            self.max_iter = max_iter
+            self.M = M
+            self.x0 = None if x0 is None else np.asarray(x0, dtype = float).ravel()
+            self.a = float(np.abs(self.A).sum(axis = 0).max()) if self.n else 0.0 # max column sum
+            self.L = None
+            self.residual = 0.0 # of the last solve
+            self.iterations = 0
+        
+        def __len__(self):
+            return(self.n)
+        
+        def factors(self):
+            return(None)
+        
+        def series_(self, y, trans = 0):
+            """
+            q = x0 + sum_k A^k * r with r = y - (I-A) * x0
+            """
+            A = self.A.T if trans else self.A
+            # |A|_1 = a bounds the terms of A, |A'|_inf = a those of A'
+            norm = (lambda x: np.abs(x).max(axis = 0)) if trans else (lambda x: np.abs(x).sum(axis = 0))
+            bound = self.a / (1 - self.a) if self.a < 1 else 1.0
+            
+            x0 = self.warm_(y)
+            t = y if x0 is None else y - x0 + A @ x0
+            q = t.copy() if x0 is None else x0 + t
+            
+            for k in range(1, self.max_iter + 1):
+                t = A @ t
+                q += t
+                self.iterations = k
+                if np.all(bound * norm(t) <= self.tol * np.maximum(norm(q), np.finfo(float).tiny)):
+                    break
+            else:
+                warn.warn("Power series did not converge in " + str(self.max_iter) + " terms")
+            
+            return(q)
+        
+        def krylov_(self, y, trans = 0):
+            """
+            (I-A) * q = y column by column
+            """
+            A = self.A.T if trans else self.A
+            op = LinearOperator((self.n, self.n), matvec = lambda x: x - A @ x, dtype = float)
+            
+            M = None
+            if self.M is not None:
+                solve = self.M.solve_T if trans else self.M.solve
+                M = LinearOperator((self.n, self.n), matvec = solve, dtype = float)
+            
+            solver = gmres if self.method == "gmres" else bicgstab
+            options = {"maxiter": self.max_iter}
+            if self.method == "gmres": # max_iter inner iterations, maxiter counts restarts
+                restart = max(min(self.max_iter, 20), 1)
+                options = {"callback_type": "pr_norm", "restart": restart, "maxiter": -(-self.max_iter // restart)}
+            
+            Y = y.reshape(self.n, -1)
+            x0 = self.warm_(y)
+            Q = np.empty_like(Y)
+            self.iterations = 0
+            for c in range(Y.shape[1]):
+                count = [0]
+                def callback(x):
+                    count[0] += 1
+                kwargs = dict(options, x0 = x0, atol = 0.0, M = M, callback = callback)
+                try:
+                    Q[:, c], info = solver(op, Y[:, c], rtol = self.tol, **kwargs)
+                except TypeError: # scipy < 1.12
+                    Q[:, c], info = solver(op, Y[:, c], tol = self.tol, **kwargs)
+                if info > 0:
+                    warn.warn(self.method + " did not converge in " + str(self.max_iter) + " iterations")
+                self.iterations = max(self.iterations, count[0])
+            
+            return(Q.reshape(y.shape))
+        
+        def warm_(self, y):
+            """
+            Warm start if it fits y (one right-hand side)
+            """
+            if self.x0 is not None and y.shape == self.x0.shape:
+                return(self.x0)
+            return(None)
+        
+        def solve_(self, y, trans = 0):
+            y = np.asarray(y, dtype = float)
+            
+            if self.method == "series":
+                q = self.series_(y, trans)
+            else:
+                q = self.krylov_(y, trans)
+            
+            A = self.A.T if trans else self.A
+            norm = max(np.abs(y).max(), np.finfo(float).tiny) if y.size else 1.0
+            self.residual = float(np.abs(y - q + A @ q).max() / norm) if y.size else 0.0
+            
+            return(q)
+        
+        def solve(self, y):
+            """
+            q = (I-A)^-1 * y
+            """
+            return(self.solve_(y))
+        
+        def solve_T(self, x):
+            """
+            m = ((I-A)^-1)' * x
+            """
+            return(self.solve_(x, 1))
+        
+        def solve_many(self, As, Y, rank = None, rtol = 1e-12):
+            """
+            q_c = (I-A_c)^-1 * y_c, each system solved iteratively
+            """
+            Y = np.asarray(Y, dtype = float)
+            Q = [SUTops.iterative(A_, self.method, self.tol, self.max_iter, self.M, self.x0).solve(Y[:, c]) for c, A_ in enumerate(As)]
+            
+            return(np.column_stack(Q) if Q else np.empty((self.n, 0)))
+        
+        def inv(self):
+            """
+            Leontief inverse
+            L = (I-A)^-1 (built once on demand, n solves)
+            """
+            if self.L is None:
+                self.L = self.solve(np.identity(self.n))
+            
+            return(self.L)
+        
+        def __matmul__(self, y):
+            return(self.solve(y))
+    
+    
+    class gras:
+        """
+        GRAS balancing of a matrix with negative entries X0 = P - N to 
+        row totals u and column totals v (Junius and Oosterhaven, 2003)
+        
+        X = diag(r) * P * diag(s) - diag(1/r) * N * diag(1/s)
+        
+        r and s are updated in turn until the largest change of r is 
+        below tol or after max_iter steps, X0 can be dense or sparse
+        
+        X = balanced matrix, iterations, residual = max|rows and columns 
+        of X - u and v| / max|u, v|, converged
+        
+        ValueError if no X can meet the targets: sum(u) != sum(v) or a 
+        nonzero total on an empty row or column of X0
+        """
+        def __init__(self, X0, u, v, tol = 1e-10, max_iter = 1000):
+            u = np.asarray(u, dtype = float).ravel()
+            v = np.asarray(v, dtype = float).ravel()
+            
+            if sp.issparse(X0):
+                X0 = sp.csr_matrix(X0, dtype = float)
+                P = X0.maximum(0)
+                N = (-X0).maximum(0)
+            else:
+                X0 = np.asarray(X0, dtype = float)
+                P = np.maximum(X0, 0)
+                N = np.maximum(-X0, 0)
+            
+            self.feasible_(abs(X0), u, v)
+            
+            # 1/x with 0 for x = 0, rows and columns set to 0 have no N
+            inv = lambda x: SUTops.diag(x).inv().x
+            
+            r = np.ones(len(u))
+            s = np.ones(len(v))
+            self.converged = False
+            self.iterations = 0
+            for k in range(1, max_iter + 1):
+                s = self.step_(P.T @ r, N.T @ inv(r), v)
+                r_ = self.step_(P @ s, N @ inv(s), u)
+                change = np.abs(r_ - r).max() if len(r) else 0.0
+                r = r_
+                self.iterations = k
+                if change < tol:
+                    self.converged = True
+                    break
+            
+            if sp.issparse(X0):
+                self.X = sp.diags(r) @ P @ sp.diags(s) - sp.diags(inv(r)) @ N @ sp.diags(inv(s))
+            else:
+                self.X = r[:, None] * P * s - inv(r)[:, None] * N * inv(s)
+            
+            norm = max(np.abs(u).max(initial = 0), np.abs(v).max(initial = 0), np.finfo(float).tiny)
+            rows = np.asarray(self.X.sum(axis = 1)).ravel() - u
+            cols = np.asarray(self.X.sum(axis = 0)).ravel() - v
+            self.residual = float(max(np.abs(rows).max(initial = 0), np.abs(cols).max(initial = 0)) / norm)
+            self.r = r
+            self.s = s
+        
+        @staticmethod
+        def feasible_(X, u, v):
+            """
+            Raises ValueError on targets no balanced matrix can meet
+            X = |X0|
+            """
+            if X.shape != (len(u), len(v)):
+                raise ValueError("GRAS targets of " + str((len(u), len(v))) + " totals for a matrix of shape " + str(X.shape))
+            
+            scale = max(np.abs(u).sum(), np.abs(v).sum(), np.finfo(float).tiny)
+            if abs(u.sum() - v.sum()) > 1e-9 * scale:
+                raise ValueError("GRAS targets are infeasible: row totals sum to " + str(u.sum()) + ", column totals to " + str(v.sum()))
+            
+            for t, x, name in [[u, X.sum(axis = 1), "rows"], [v, X.sum(axis = 0), "columns"]]:
+                empty = np.flatnonzero((np.asarray(x).ravel() == 0) & (t != 0))
+                if len(empty):
+                    raise ValueError("GRAS targets are infeasible: empty " + name + " " + str(list(empty[:10])) + " have nonzero totals")
+        
+        @staticmethod
+        def step_(p, n, t):
+            """
+            Multipliers x solving x * p - n / x = t
+            x = (t + sqrt(t^2 + 4 * p * n)) / (2 * p), -n / t if p = 0,
+            1 for empty rows or columns
+            """
+            p = np.asarray(p).ravel()
+            n = np.asarray(n).ravel()
+            x = np.ones(len(t))
+            
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                pos = p > 0
+                x[pos] = (t[pos] + np.sqrt(t[pos]**2 + 4 * p[pos] * n[pos])) / (2 * p[pos])
+                neg = ~pos & (n > 0) & (t < 0)
+                x[neg] = -n[neg] / t[neg]
+            
+            return(x)
+    
+    
+    def sparse(M):
+        """
+        Compressed sparse row copy of M for the sparse backend
+        """
+        if sp.issparse(M):
+            return(M.tocsr())
+        
+        return(sp.csr_matrix(np.asarray(M, dtype = float)))
+    
+    
+    def astype(M, dtype):
+        """
+        M stored in dtype (sparse, pandas or numpy)
+        """
+        if hasattr(M, "astype") and not isinstance(M, np.ndarray):
+            return(M.astype(dtype)) # sparse and pandas
+        
+        return(np.asarray(M, dtype = dtype))
+    
+    
+    def residual(A, y, q):
+        """
+        Relative residual of q in the float64 system
+        max|y - (I-A) * q| / max|y|
+        """
+        r = np.asarray(y, dtype = float) - q + np.asarray(A @ q, dtype = float).reshape(np.shape(q))
+        
+        return(np.abs(r).max() / max(np.abs(y).max(), np.finfo(float).tiny))
+    
+    
+    def sum_(M, axis):
+        """
+        np.sum that also returns flat arrays for sparse matrices
+        """
+        if sp.issparse(M):
+            return(np.asarray(M.sum(axis = axis)).ravel())
+        
+        return(np.sum(M, axis = axis))
+    
+    
     def inv(x):
         """
         Returns inverse by dividing by 1 and eliminating inf and nan values
+        diagonals are inverted as vectors and returned as diag
         """
-        x = 1/x
-        x[x == np.inf ] = 0
-        x[x == np.nan ] = 0
+        if isinstance(x, SUTops.diag):
+            return(x.inv())
+        
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            x = 1/x
+        x[~np.isfinite(x)] = 0
 
         return(x)
     
     
-    def var(self,V, U, Y, E):
+    def var(self, V, U, Y, E, n_va = 9):
         """
         Returns variables that are useful in all calculations
+        n_va = value added rows at the top of E
         """
         V = np.mat(V)
         U = np.mat(U)
         Y = np.mat(Y)
         E = np.mat(E)
 
-        e = E[:9].sum(axis = 0).getA1() 
+        e = E[:n_va].sum(axis = 0).getA1() 
         yi = Y.sum(axis = 1).getA1()
         yj = Y.sum(axis = 0).getA1()
         q = V.sum(axis = 1).getA1()
         g = V.sum(axis = 0).getA1()
                    
-        diag_yi = np.diag(yi)
-        inv_diag_yi = self.inv(diag_yi)
+        diag_yi = self.diag(yi)
+        inv_diag_yi = diag_yi.inv()
         
         
-        diag_yj = np.diag(yj)
-        inv_diag_yj = self.inv(diag_yj)
+        diag_yj = self.diag(yj)
+        inv_diag_yj = diag_yj.inv()
 
-        diag_q = np.diag(q)
-        inv_diag_q = self.inv(diag_q)
+        diag_q = self.diag(q)
+        inv_diag_q = diag_q.inv()
 
-        diag_g = np.diag(g)
-        inv_diag_g = self.inv(diag_g)
+        diag_g = self.diag(g)
+        inv_diag_g = diag_g.inv()
 
         p = {"e":e,
              "yi":yi,
@@ -86,22 +743,20 @@ class SUTops:
             Transformation matrix
             T = inv(diag(g)) * V
             """
-            T = inv_diag_g @ V
+            T = inv_diag_g.rows(V)
             
             return (T)
 
-        def L(U, T, inv_diag_q):
+        def L(U, T, inv_diag_q, dtype = np.float64):
             """ 
             Input coefficients intermediates            
             A = U * T * inv[diag (q)] 
             
             Multiplier matrix            
-            L =  (I-A)^-1 
+            L =  (I-A)^-1 as a factorized leontief system
             """                
-            A = U @ T @ inv_diag_q # technical coefficient matrix         
-            I = np.identity(len(A))         
-            IA = I - A
-            L = ln.inv(IA) 
+            A = inv_diag_q.cols(U @ T) # technical coefficient matrix         
+            L = SUTops.leontief(A, dtype) 
             
             return(L)
 
@@ -112,7 +767,7 @@ class SUTops:
             
             """            
             BT = B @ T 
-            R = BT @ inv_diag_q  # Input coefficients 
+            R = inv_diag_q.cols(BT)  # Input coefficients 
             return (R)
 				                      
 
@@ -120,7 +775,7 @@ class SUTops:
             """ 
             Extensions and primary input for IO tables 
             """           
-            B = R @ diag_q 
+            B = diag_q.cols(R) 
             
             return (B)
 			   
@@ -145,7 +800,7 @@ class SUTops:
             Input requirements 
             Z = U * inv(diag(g)) 
             """
-            Z = U @ inv_diag_g            
+            Z = inv_diag_g.cols(U)
             
             return(Z)
 
@@ -156,7 +811,7 @@ class SUTops:
             Market share coefficients            
             D = V * inv(diag(q)) 
             """
-            D = V @ inv_diag_q
+            D = inv_diag_q.cols(V)
             
             return(D)
         
@@ -168,14 +823,12 @@ class SUTops:
             A = Z @ D
             return(A)
 
-        def L(A):
+        def L(A, dtype = np.float64):
             """
             Leontief inverse
-            L = (I-A)^-1
+            L = (I-A)^-1 as a factorized leontief system
             """
-            I = np.identity(len(A)) 
-            IA = I - A
-            L= ln.inv(IA) 
+            L = SUTops.leontief(A, dtype) 
 
             return(L)   
 
@@ -185,7 +838,7 @@ class SUTops:
             R = E * inv(diag(g)) 
             
             """            
-            R_ = B @ inv_diag_g 
+            R_ = inv_diag_g.cols(B)
             R = R_ @ D
             return (R)
         
@@ -193,7 +846,7 @@ class SUTops:
             """ 
             Extensions and primary input for IO tables 
             """           
-            B = R @ diag_q 
+            B = diag_q.cols(R) 
             
             return (B)
             
@@ -203,7 +856,7 @@ class SUTops:
             S = Z * D * diag(q) 
             """
 
-            S = Z @ D @ diag_q 
+            S = diag_q.cols(Z @ D)
             
             return (S)
             
@@ -218,7 +871,7 @@ class SUTops:
             """
             total product output s the sum of Si and y
             """
-            q =  np.sum(S, axis = 1) + np.sum(Y, axis = 1)
+            q =  SUTops.sum_(S, 1) + np.sum(Y, axis = 1)
             
             return(q)
 
@@ -226,7 +879,7 @@ class SUTops:
             """
             Primary input and intermediates extensions coefficient matrix
             """
-            R = B @ inv_diag_q
+            R = inv_diag_q.cols(B)
 
             return(R)
         
@@ -234,7 +887,7 @@ class SUTops:
             """
             Primary input and intermediates extensions matrix
             """
-            B = R @ diag_q
+            B = diag_q.cols(R)
 
             return(B)
 
@@ -242,8 +895,12 @@ class SUTops:
             """
             Total product ouput        
             q = inv(I - A) * yi
+            L can be the explicit inverse or a leontief/woodbury system
             """
-            q = np.dot(L, y)
+            if hasattr(L, "solve"):
+                q = L.solve(y)
+            else:
+                q = np.dot(L, y)
             
             return (q)
         
@@ -253,7 +910,7 @@ class SUTops:
             Total product ouput        
             S = A * diag_q
             """
-            S = A @ diag_q
+            S = diag_q.cols(A)
             
             return (S)	
         
@@ -263,18 +920,16 @@ class SUTops:
             Technical coefficient matrix          
             A = S * inv(diag(q)) 
             """            
-            A = S @ inv_diag_q
+            A = inv_diag_q.cols(S)
             
             return(A)
 
-        def L(A):
+        def L(A, dtype = np.float64):
             """
             Leontief inverse
-            L = (I-A)^-1
+            L = (I-A)^-1 as a factorized leontief system
             """
-            I = np.identity(len(A)) 
-            IA = I - A
-            L = ln.inv(IA)
+            L = SUTops.leontief(A, dtype)
 
             return(L)   
             
@@ -286,7 +941,7 @@ class SUTops:
             (e.g. final demand emissions)
             RB = YB * inv(diag(yj))
             """
-            YRB = YB @ inv_diag_yj
+            YRB = inv_diag_yj.cols(YB)
             
             return (YRB)
     				                      
@@ -294,7 +949,7 @@ class SUTops:
             """ 
             Extensions and primary input for IO tables 
             """
-            YB = YRB @ diag_yj
+            YB = diag_yj.cols(YRB)
         
             return (YB)
 
@@ -319,14 +974,17 @@ class SUTops:
             L = Leontief of baseline
             Lalt = Leontief of scenario    				        
             """
-            delta_q = (L-Lalt) @ y
+            delta_q = SUTops.IOT.q_IAy(L, y) - SUTops.IOT.q_IAy(Lalt, y)
             
             return (delta_q)
 
-    def verifyIOT(S, Y, E):
-        
-        q1 = np.sum(S, axis = 1) + np.sum(Y, axis = 1)
-        q2 = np.sum(S, axis = 0) + np.sum(E[:9], axis = 0)
+    def verifyIOT(S, Y, E, n_va = 9):
+        """
+        Balance of product input and output in %
+        n_va = value added rows at the top of E
+        """
+        q1 = SUTops.sum_(S, 1) + np.sum(Y, axis = 1)
+        q2 = SUTops.sum_(S, 0) + SUTops.sum_(E[:n_va], 0)
         
         ver = q1/q2 * 100
         ver = ver.fillna(0)
@@ -12,17 +12,43 @@ Scope: MSc research Modelling circular economy policies in EEIOA
 """
 from SUTops import SUTops as sops
 import numpy as np
+import profiler
+from lazy import LazyIOT
 
 class Transform:
+    """
+    sparse = False (dense numpy/pandas matrices)
+             True (V, U, E and B extensions are kept as scipy sparse
+                   matrices and the Leontief system uses sparse LU,
+                   tables are made dense when labelled, see labels.df)
+    precision = "float64"
+                "float32" (coefficient and extension matrices are stored
+                           in float32, the Leontief system is solved in 
+                           float32 and q refined in float64, see error)
+    n_va = value added rows at the top of E (see Labels.value_added)
+    """
     
-    def __init__(self, SUTs):
+    precisions = {"float64": np.float64, "float32": np.float32}
+    
+    # matrices stored in the precision of the IOT
+    stored = ["A", "S", "T", "D", "RE", "E", "RBe", "Be", "RBr", "Br", "RBm", "Bm"]
+    
+    @profiler.timed("Transform")
+    def __init__(self, SUTs, sparse = False, precision = "float64", n_va = 9):
+        
+        if precision not in self.precisions:
+            raise KeyError("Only the following precisions are allowed =>" + str(list(self.precisions)))
+        
+        self.dtype = self.precisions[precision]
+        self.error = None # error of the low precision IOT (see precision_)
+        self.n_va = n_va
         
         # Baseline monetary data
         self.V = SUTs["V"] # Supply matrix 
         self.U = SUTs["U"] # Intermediate use        
         self.Y = SUTs["Y"] # Final demand
         self.Tm = SUTs["Tm"] # Trade margins
-        self.E = SUTs["E"] # Primary input !!! always check that it's only E[0:9] if you want to do a balance !!!
+        self.E = SUTs["E"] # Primary input, only E[:n_va] (value added) balances the industry output
         self.Be = SUTs["Be"] # Environmental extension 
         self.YBe = SUTs["YBe"] # Environmental extension final demand
         self.Br = SUTs["Br"] # Resources extension 
@@ -30,18 +56,27 @@ class Transform:
         self.Bm = SUTs["Bm"] # Materials extension 
         self.YBm = SUTs["YBm"] # Materials extension final demand
         
+        self.sparse = sparse
+        if sparse:
+            self.V = sops.sparse(self.V)
+            self.U = sops.sparse(self.U)
+            self.E = sops.sparse(self.E)
+            self.Be = sops.sparse(self.Be)
+            self.Br = sops.sparse(self.Br)
+            self.Bm = sops.sparse(self.Bm)
+        
         # baseline variables
-        self.e = np.sum(self.E[:9], axis = 0)    
+        self.e = sops.sum_(self.E[:self.n_va], 0)    
         self.yi = np.array(np.sum(self.Y, axis = 1)) # row sum of final demand
         self.yj = np.array(np.sum(self.Y, axis = 0)) # column sum of final demand
-        self.q = np.sum(self.V, axis = 1) # total product output
-        self.g = np.sum(self.V, axis = 0) # total industry output
+        self.q = sops.sum_(self.V, 1) # total product output
+        self.g = sops.sum_(self.V, 0) # total industry output
         
         # bv diagonals
-        self.diag_q = np.diag(self.q) # diagonal of q
-        self.diag_g = np.diag(self.g) # diagonal of g
-        self.diag_yi = np.diag(self.yi) # diagonal of yi         
-        self.diag_yj = np.diag(self.yj) # diagonal of yj
+        self.diag_q = sops.diag(self.q) # diagonal of q
+        self.diag_g = sops.diag(self.g) # diagonal of g
+        self.diag_yi = sops.diag(self.yi) # diagonal of yi         
+        self.diag_yj = sops.diag(self.yj) # diagonal of yj
         
         # bv inverses
         self.inv_diag_yi = sops.inv(self.diag_yi)
@@ -49,6 +84,7 @@ class Transform:
         self.inv_diag_q = sops.inv(self.diag_q)
         self.inv_diag_g = sops.inv(self.diag_g)        
         
+    @profiler.timed("IOTpxpSTA_TCm")
     def IOTpxpSTA_TCm(self):
         """ 
         IOT prod x prod Single tech Industry-technology as. 
@@ -56,18 +92,11 @@ class Transform:
         """
         
         T = sops.TC_STA.T(self.inv_diag_g, self.V.transpose()) # transformation matrix
-        L = sops.TC_STA.L(self.U, T, self.inv_diag_q) # leontief inverse
+        L = sops.TC_STA.L(self.U, T, self.inv_diag_q, self.dtype) # leontief inverse
         RE = sops.TC_STA.R(self.E, T, self.inv_diag_q) # primary inputs coefficients
         E = sops.TC_STA.B(RE, self.diag_q) # primary inputs
-    
-        RBe = sops.TC_STA.R(self.Be, T, self.inv_diag_q) # Be coefficient matrix
-        Be = sops.TC_STA.B(RBe, self.diag_q) # environmental extensions
         
-        RBr = sops.TC_STA.R(self.Br, T, self.inv_diag_q) # Br coefficient matrix
-        Br = sops.TC_STA.B(RBr, self.diag_q) # resource extensions
-    
-        RBm = sops.TC_STA.R(self.Bm, T, self.inv_diag_q) # Bm coefficient matrix
-        Bm = sops.TC_STA.B(RBm, self.diag_q) # Material extension
+        R = lambda B: sops.TC_STA.R(B, T, self.inv_diag_q) # extension coefficients
        
         S = sops.TC_STA.S(T, self.U) # intermediates
         q = sops.IOT.q_IAy(L, self.yi) # total product ouput
@@ -76,27 +105,26 @@ class Transform:
         
         Y = self.Y        
         
-        ver_base = sops.verifyIOT(S, Y, E)
+        ver_base = sops.verifyIOT(S, Y, E, self.n_va)
         
-        IOT = {"q":q,
-               "T":T, 
-               "Y": Y,
-               "A":A,
-               "RE":RE,
-               "Be":Be,
-               "RBe":RBe,
-               "Br":Br,
-               "RBr":RBr,
-               "Bm":Bm,
-               "RBm":RBm,
-               "L":L,
-               "E":E,
-               "S":S,
-               "ver":ver_base
-               }
+        IOT = LazyIOT({"q":q,
+                       "T":T, 
+                       "Y": Y,
+                       "A":A,
+                       "RE":RE,
+                       "L":L,
+                       "E":E,
+                       "S":S,
+                       "ver":ver_base
+                       })
+        
+        # environmental, resource and material extensions on first access
+        for l in ["Be", "Br", "Bm"]:
+            IOT.define(["R" + l, l], self.ext_(getattr(self, l), R, sops.TC_STA.B))
                
-        return(IOT)
+        return(self.precision_(IOT))
         
+    @profiler.timed("IOTpxpSTA_MSCm")
     def IOTpxpSTA_MSCm(self):
         """ 
         IOT prod x prod Single tech Industry-technology as. 
@@ -106,18 +134,11 @@ class Transform:
         Z = sops.MSC_STA.Z(self.U, self.inv_diag_g) # industry intermediates coefficients
         D = sops.MSC_STA.D(self.V.transpose(), self.inv_diag_q) # Market shares
         A = sops.MSC_STA.A(Z, D) # technical coefficient matrix 
-        L = sops.MSC_STA.L(A) # leontief inverse
+        L = sops.MSC_STA.L(A, self.dtype) # leontief inverse
         RE = sops.MSC_STA.R(self.E, D, self.inv_diag_g) # primary inputs    
         E = sops.MSC_STA.B(RE, self.diag_q)
-    
-        RBe = sops.MSC_STA.R(self.Be, D, self.inv_diag_g) # Be coefficient matrix
-        Be = sops.MSC_STA.B(RBe, self.diag_q) # environmental extensions
         
-        RBr = sops.MSC_STA.R(self.Br, D, self.inv_diag_g) # Br coefficient matrix
-        Br = sops.MSC_STA.B(RBr, self.diag_q) # resource extensions
-    
-        RBm = sops.MSC_STA.R(self.Bm, D, self.inv_diag_g) # Bm coefficient matrix
-        Bm = sops.MSC_STA.B(RBm, self.diag_q) # Material extension
+        R = lambda B: sops.MSC_STA.R(B, D, self.inv_diag_g) # extension coefficients
     
         S = sops.MSC_STA.S(Z, D, self.diag_q) # intermediates
         q = sops.IOT.q_IAy(L, self.yi) # total product output
@@ -126,34 +147,71 @@ class Transform:
         
         Y = self.Y  
         
-        ver_base = sops.verifyIOT(S, Y, E)
+        ver_base = sops.verifyIOT(S, Y, E, self.n_va)
         
-        IOT = {"RE":RE,
-               "A":A,
-               "D":D,
-               "Be":Be,
-               "RBe":RBe,
-               "Br":Br,
-               "RBr":RBr,
-               "Bm":Bm,
-               "RBm":RBm,
-               "L":L,
-               "S":S,
-               "E":E,
-               "q":q,
-               "ver":ver_base
-               }
+        IOT = LazyIOT({"RE":RE,
+                       "A":A,
+                       "D":D,
+                       "L":L,
+                       "S":S,
+                       "E":E,
+                       "q":q,
+                       "ver":ver_base
+                       })
+        
+        # environmental, resource and material extensions on first access
+        for l in ["Be", "Br", "Bm"]:
+            IOT.define(["R" + l, l], self.ext_(getattr(self, l), R, sops.MSC_STA.B))
                
+        return(self.precision_(IOT))
+    
+    def ext_(self, B, R, B_):
+        """
+        Coefficients and extensions of an extension block B
+        R(B) = coefficients, B_(R, diag_q) = extensions
+        """
+        def fn():
+            RB = R(B)
+            return(RB, B_(RB, self.diag_q))
+        
+        return(fn)
+    
+    def precision_(self, IOT):
+        """
+        Stores the IOT matrices in the precision of the Transform and
+        reports its error against the float64 path (error):
+            iterations, refinement steps of the Leontief solve
+            residual, max|yi - (I-A) * q| / max|yi| with the float64 A
+            ver_error, max difference of verifyIOT (in %) between the 
+                       stored and the float64 S and E
+        """
+        if self.dtype == np.float64:
+            return(IOT)
+        
+        A = IOT["A"]
+        for l in self.stored:
+            if l in IOT:
+                IOT.then(l, lambda M: sops.astype(M, self.dtype))
+        
+        ver = sops.verifyIOT(IOT["S"], self.Y, IOT["E"], self.n_va)
+        
+        self.error = {"dtype": np.dtype(self.dtype).name,
+                      "iterations": IOT["L"].iterations,
+                      "residual": sops.residual(A, self.yi, IOT["q"]),
+                      "ver_error": float(np.abs(ver - IOT["ver"]).max())
+                      }
+        
         return(IOT)
     
     
     @staticmethod
-    def IOT(S, Y, E, Be, Br, Bm):
+    def IOT(S, Y, E, Be, Br, Bm, n_va = 9):
         """ 
         IOT
+        n_va = value added rows at the top of E
         """
         q = sops.IOT.q(S, Y) # total product output
-        diag_q = np.diag(q)
+        diag_q = sops.diag(q)
         inv_diag_q = sops.inv(diag_q)
         
         y = np.sum(Y, axis = 1)
@@ -176,7 +234,7 @@ class Transform:
         S = sops.IOT.S(A, diag_q) # intermediates
         q = sops.IOT.q_IAy(L, y)
     
-        ver_base = sops.verifyIOT(S, Y, E)
+        ver_base = sops.verifyIOT(S, Y, E, n_va)
     
         IOT = {"A":A,
                "S":S,
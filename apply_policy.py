@@ -14,23 +14,36 @@ Scope: MSc research Modelling circular economy policies in EEIOA
 import pandas as pd
 import numpy as np
 from dirs import scen_file
+from labels import Resolver
+from dirs import SUT
+import sut_store
+import scen_plan
+import profiler
 
 class Apply_policy:
 
-    def __init__(self):
+    def __init__(self, regions = None):
+        """
+        regions = regions allowed in the scenarios, by default those of 
+                  the loaded SUT (see sut_store.regions)
+        """
+        if regions is None:
+            regions = sut_store.regions(SUT)
         
-        self.regions = ["EU","ROW"]
+        self.regions = list(regions)
+        self.res = Resolver(self.regions) # label => position lookups
     
 
     def select_(self, sheet_name, M_name):
         """
         separates policy interventions by matrix subject to intervention
         M_name = name of the matrix that is going to be modified
+        
+        the scenario file is read once (see scen_plan)
         """
-        scenario = pd.read_excel(scen_file, sheet_name, header = 1, 
-                                 index = None)
+        plan = scen_plan.load(scen_file, self.regions)
         
-        fltr_policies = scenario.loc[scenario['matrix'] == M_name]
+        fltr_policies = plan.select_(sheet_name, M_name)
     
         return(fltr_policies)
     
@@ -85,97 +98,39 @@ class Apply_policy:
     def policy_engine(self, inter, M, xa, ya, xb = None, yb =None, 
                       kt = None, kp = None, expan = None, fx_kp = None, 
                       ignore_rest = False):
-        
-        
-        
-        # I am not trusting lexsorting to keep keys position with the type 
-        # of multindexing I have set up. So I am flipping the index levels
-        # Ideally we would just work with numpy.matrix or numpy.array and assign
-        # integers to string type keys.
-        # This is in hindsight. Now it is what it is. It should be fixed in the
-        # future, not just for cleanness but to improve speed in case one wants 
-        # to work with a multiregional system that is bigger than two regions
-        # I can imagine having 48 regions in a large dataframe would make 
-        # handling this type of modelling an unneccessary challenge
-
-       
-        try:
-            if type(xa) == tuple:
-                if xa[0] in self.regions:
-                    
-                    if M.index.names[1] == "reg":
-                        M.index = M.index.swaplevel(0, 1)
-                elif xa[0] not in self.regions:
-
-                    if M.index.names[0] == "reg":
-                        M.index = M.index.swaplevel(0, 1)
-
-            elif type(xa) == str:
-                if xa in self.regions:
-                    if M.index.names[1] == "reg":
-                        M.index = M.index.swaplevel(0, 1)
-                
-                elif xa not in self.regions:
-                    if M.index.names[0] == "reg":
-                        M.index = M.index.swaplevel(0, 1)
-        except TypeError:
-            pass
-        
-        try:
-            if type(ya) == tuple:
-                if ya[0] in self.regions:
-                    if M.columns.names[1] == "reg":
-                        M.columns = M.columns.swaplevel(0, 1)
-                elif ya[0] not in self.regions:
-                    if M.columns.names[0] == "reg":
-                        M.columns = M.columns.swaplevel(0, 1)
-
-            elif type(ya) == str:
-                if ya in self.regions:
-                    if M.columns.names[1] == "reg":
-                        M.columns = M.columns.swaplevel(0, 1)
-                
-                elif ya not in self.regions:
-                    if M.columns.names[0] == "reg":
-                        M.columns = M.columns.swaplevel(0, 1)
-        except TypeError:
-            pass
-            
-        try:
-            a = np.array(M.loc[xa,ya])
-        except KeyError:
-            try:
-                a = np.array(M.loc[xa,[ya]])
-                t = str(M.columns.names)
-                i = str(M.index.names)
-            except KeyError:
-                what = " : " + "index level name in position 0 (" + i + "), the keys you want to pass in the index are (" + str(xa) + ") - the column level name in position 0 (" + t +"), the keys you are tying to pass (" +  str(ya) +")" 
-                raise KeyError("I tried but there is something wrong with the index. This is what I have been trying to process " + what)
-                return(M)
+        """
+        Apply one intervention on M, keys are resolved to integer positions
+        (see labels.Resolver) and the values are read and written by position
+        """
+        ra = self.res.positions(M.index, xa)
+        ca = self.res.positions(M.columns, ya)
+        a = np.array(M.values[self.res.ix_(ra, ca)])
 
         if inter != "expansion":
             b = self.ops.direct(a, kt, kp)
             
             if inter == "indirect":
                 c = a - b
-                d = np.array(M.loc[xb,yb])
-                M.loc[xb,yb] = self.ops.indirect(d, c, fx_kp)
+                rb = self.res.positions(M.index, xb)
+                cb = self.res.positions(M.columns, yb)
+                d = np.array(M.values[self.res.ix_(rb, cb)])
+                M.iloc[rb, cb] = self.ops.indirect(d, c, fx_kp)
             
             elif inter == "direct":
-                M.loc[xa,ya] = b
+                M.iloc[ra, ca] = b
             
 
 
         
         elif inter == "expansion":
             b = self.ops.expansion(a, expan)
-            M.loc[xa, ya] = b
+            M.iloc[ra, ca] = b
 
         
         if ignore_rest == True:
             
             if inter == "direct":
-                verify_application = M.loc[xa,ya]
+                verify_application = M.iloc[ra, ca]
                 
                 comp = {"kt":kt, 
                         "kp":kp, 
@@ -184,7 +139,7 @@ class Apply_policy:
                         "verify_application":verify_application}
 
             elif inter == "indirect":
-                verify_application = M.loc[xb,yb]
+                verify_application = M.iloc[rb, cb]
 
                 comp = {"kt":kt, 
                         "kp":kp, 
@@ -193,7 +148,7 @@ class Apply_policy:
                         "verify_application":verify_application}
 
             elif inter == "expansion":
-                verify_application = M.loc[xa,ya]
+                verify_application = M.iloc[ra, ca]
                 
                 comp = {"expan":expan, 
                         "original_value":a, 
@@ -486,6 +441,116 @@ class Apply_policy:
         
         
     
+    def keys_(self, cat, reg1, stage, reg2):
+        """
+        Row and column keys of an intervention as used in intersect_n_apply
+        (category, region), category, region or slice(None) for all
+        
+        reg1 only selects rows and reg2 only columns, e.g. a category
+        without reg1 and a reg2 is the category in every region, in the
+        columns of reg2 (M.loc[cat, reg2] took the row (cat, reg2))
+        """
+        if pd.isnull(cat) == False:
+            x = (cat, reg1) if pd.isnull(reg1) == False else cat
+        else:
+            x = reg1 if pd.isnull(reg1) == False else slice(None)
+        
+        if pd.isnull(stage) == False:
+            y = (stage, reg2) if pd.isnull(reg2) == False else stage
+        else:
+            y = reg2 if pd.isnull(reg2) == False else slice(None)
+        
+        return(x, y)
+    
+    def compile_(self, fltr_policies, M):
+        """
+        Multiplier (K) and additive (P) matrices of all the interventions
+        on M, so that the new matrix is M * K + P
+        
+        Interventions are compiled in the same order as make_new applies
+        them (row by row, life => sharing => recycling) and each one is
+        evaluated on the values left by the previous ones, so interactions
+        on the same transactions are the same as in the sequential engine
+        """
+        M0 = np.asarray(M, dtype = float)
+        K = np.ones(M0.shape)
+        P = np.zeros(M0.shape)
+        
+        def current(ix):
+            return(M0[ix] * K[ix] + P[ix])
+        
+        def scale(ix, a, f, new):
+            # multiplicative change, otherwise the block is set to its new value
+            if np.isfinite(f) and np.isfinite(a).all():
+                K[ix] *= f
+                P[ix] *= f
+            else:
+                K[ix] = 0
+                P[ix] = new
+        
+        for l, row in fltr_policies.iterrows():
+            inter = row["intervention"]
+            xa, ya = self.keys_(row["catA"], row["reg_A1"], row["stageA"], row["reg_A2"])
+            ixa = self.res.ix_(self.res.positions(M.index, xa), self.res.positions(M.columns, ya))
+            
+            if inter in ["direct", "indirect"]:
+                k = [[row["life"], row["l_kp"]],
+                     [row["share"], row["s_kp"]],
+                     [row["recycle"], row["r_kp"]]]
+                k = [[kt, kp] for kt, kp in k if pd.isnull(kt) == False]
+            elif inter == "expansion" and pd.isnull(row["expansion"]) == False:
+                k = [[row["expansion"], None]]
+            else:
+                k = []
+            
+            if inter == "indirect" and len(k) > 0:
+                xb, yb = self.keys_(row["catB"], row["reg_B1"], row["stageB"], row["reg_B2"])
+                ixb = self.res.ix_(self.res.positions(M.index, xb), self.res.positions(M.columns, yb))
+            
+            for kt, kp in k:
+                a = current(ixa)
+                
+                if inter == "direct":
+                    b = self.ops.direct(a, kt, kp)
+                    scale(ixa, a, 1 - kt * kp * 1e-4, b)
+                
+                elif inter == "expansion":
+                    b = self.ops.expansion(a, kt)
+                    scale(ixa, a, 1 + kt * 1e-2, b)
+                
+                elif inter == "indirect":
+                    c = a - self.ops.direct(a, kt, kp)
+                    d = current(ixb)
+                    new = self.ops.indirect(d, c, row["fx_kp"])
+                    add = c * row["fx_kp"] * 1e-2
+                    
+                    if np.broadcast(d, add).shape != d.shape:
+                        raise ValueError("The transactions of catB/stageB " + str((xb, yb)) + " do not match those of catA/stageA " + str((xa, ya)))
+                    
+                    if np.isfinite(add).all() and np.isfinite(d).all():
+                        P[ixb] += add
+                    else:
+                        K[ixb] = 0
+                        P[ixb] = new
+        
+        return(K, P)
+    
+    def vect_new(self, fltr_policies, M):
+        """
+        Recreates M from the compiled policy interventions in one operation
+        M_ = M * K + P
+        """
+        if len(fltr_policies) == 0:
+            return(M)
+        
+        K, P = self.compile_(fltr_policies, M)
+        M_ = pd.DataFrame(np.asarray(M, dtype = float) * K + P, 
+                          index = M.index, columns = M.columns)
+        
+        return(M_)
+    
+    
+    @profiler.timed("apply_policy", "scen_no", "M_name")
     def apply_policy(self, scen_no, M, M_name, ignore_rest = False):
         """ 
         Apply policy interventions on specific matrix    
@@ -493,6 +558,8 @@ class Apply_policy:
         scen_no = specific scenario e.g "1" or "scenario_1" 
         M = matrix affected by the policies     
         M_name = matrix name as diplayed under sheet_name["matrix"]
+        ignore_rest = True, apply them one by one with make_new and return
+                      the matrix with the verification of each change
         
         """
         if type(scen_no) is int:
@@ -504,6 +571,11 @@ class Apply_policy:
             raise KeyError("only integer or explicit name (scenario_x) is allowed")
         
         select = self.select_(scen_no, M_name)
-        matrix = self.make_new(select, M, M_name, ignore_rest)
+        
+        if ignore_rest == True:
+            # make_new changes M in place, M may be shared with the baseline
+            matrix = self.make_new(select, M.copy(True), M_name, ignore_rest)
+        else:
+            matrix = self.vect_new(select, M)
         
         return (matrix)
\ No newline at end of file
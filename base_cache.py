@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Description: Content-addressed disk cache of the transformed baseline IOT,
+             entries are keyed by a hash of the SUT, of the labels, of the
+             code and of the transformation options, written as sut_store
+             directories and memory-mapped when loaded, the least recently
+             used entries are evicted above a size limit
+"""
+import os
+import json
+import shutil
+import hashlib
+import sut_store
+from sut_store import Store
+import profiler
+
+# modules whose changes invalidate the cached baselines
+code = ["SUTtoIOT.py", "SUTops.py", "base_n_scen.py", "labels.py", "sut_store.py", "lazy.py", "base_cache.py"]
+
+
+def file_hash(path, chunk = 2**24):
+    """
+    sha256 of a file
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for b in iter(lambda: f.read(chunk), b""):
+            h.update(b)
+
+    return(h.hexdigest())
+
+
+class Cache:
+    """
+    Baseline IOTs on disk, one store directory per key
+
+    directory = cache directory
+    max_bytes = size above which the least recently used entries are evicted
+    """
+    hashes = "hashes.json" # file hashes by path, size and modification time
+
+    def __init__(self, directory, max_bytes = 10 * 2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def hash_(self, path):
+        """
+        Hash of a file, computed again only when its size or mtime change
+        """
+        memo_path = os.path.join(self.directory, self.hashes)
+        memo = {}
+        if os.path.exists(memo_path):
+            try:
+                with open(memo_path) as f:
+                    memo = json.load(f)
+            except ValueError:
+                memo = {}
+
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime]
+        name = os.path.abspath(path)
+
+        if name not in memo or memo[name][0] != stamp:
+            with profiler.stage("hash", file = path):
+                memo[name] = [stamp, file_hash(path)]
+
+            os.makedirs(self.directory, exist_ok = True)
+            tmp = memo_path + "." + str(os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(memo, f)
+            os.replace(tmp, memo_path)
+
+        return(memo[name][1])
+
+    def sources(self, SUT):
+        """
+        Files a SUT store is read from, its pickle or else its matrices
+        """
+        if SUT.source is not None and os.path.exists(SUT.source):
+            return([SUT.source])
+
+        SUT.labels # converted if needed
+
+        return(sorted([os.path.join(SUT.directory, f) for f in os.listdir(SUT.directory)]))
+
+    def key(self, SUT, index, **options):
+        """
+        Key of a baseline, options are those of the transformation
+        e.g. key(SUT, index, method = 0, sparse = False, precision = "float64")
+        """
+        here = os.path.dirname(os.path.abspath(__file__))
+
+        h = hashlib.sha256()
+        for path in self.sources(SUT) + [index] + [os.path.join(here, m) for m in code]:
+            h.update(self.hash_(path).encode())
+        h.update(json.dumps(options, sort_keys = True, default = str).encode())
+
+        return(h.hexdigest()[:32])
+
+    def load(self, key):
+        """
+        Cached matrices of key (memory-mapped) or None
+        """
+        path = os.path.join(self.directory, key)
+
+        if not os.path.exists(os.path.join(path, sut_store.label_table)):
+            return(None)
+
+        os.utime(path) # recently used
+
+        with profiler.stage("load cache", key = key):
+            data = dict(Store(path))
+
+        return(data)
+
+    def save(self, key, data):
+        """
+        Writes the matrices of key, then evicts old entries
+        """
+        path = os.path.join(self.directory, key)
+        if os.path.exists(os.path.join(path, sut_store.label_table)):
+            return
+        
+        tmp = path + ".tmp" + str(os.getpid())
+
+        with profiler.stage("save cache", key = key):
+            sut_store.write(data, tmp, dtype = None)
+            try:
+                os.rename(tmp, path)
+            except OSError: # written by another run meanwhile
+                shutil.rmtree(tmp, ignore_errors = True)
+
+        self.evict(keep = key)
+
+    def add(self, key, data):
+        """
+        Adds matrices to the entry of key, created if missing
+        """
+        path = os.path.join(self.directory, key)
+        
+        with profiler.stage("save cache", key = key, matrices = list(data)):
+            sut_store.write(data, path, dtype = None, append = True)
+        
+        self.evict(keep = key)
+    
+    def entries(self):
+        """
+        Entries as (last use, bytes, key), least recently used first
+        """
+        entries = []
+        if not os.path.exists(self.directory):
+            return(entries)
+
+        for key in os.listdir(self.directory):
+            path = os.path.join(self.directory, key)
+            if not os.path.isdir(path) or ".tmp" in key:
+                continue
+            size = sum([os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)])
+            entries.append((os.path.getmtime(path), size, key))
+
+        return(sorted(entries))
+
+    def evict(self, keep = None):
+        """
+        Removes the least recently used entries until the cache fits max_bytes
+        """
+        entries = self.entries()
+        total = sum([size for t, size, key in entries])
+
+        for t, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors = True)
+            total -= size
+
+    def clear(self):
+        for t, size, key in self.entries():
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors = True)
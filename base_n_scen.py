@@ -13,108 +13,410 @@ Scope: MSc research Modelling circular economy policies in EEIOA
 
 from apply_policy import Apply_policy
 from dirs import SUT
+from dirs import scen_file
+from dirs import index
+from dirs import base_cache
 import SUTtoIOT as si
 from SUTops import SUTops as sops
 from labels import Labels as lb
+from labels import df
 import numpy as np
+import pandas as pd
 import warnings as warn
+import profiler
+import scen_plan
+from lazy import LazyIOT
 lb = lb()
 
 class Base_n_scen:
     
-    def __init__(self, method = 0):
+    fd_matrices = ["Y", "RYBe", "RYBr", "RYBm"] # final demand only scenarios
+    
+    def __init__(self, method = 0, sparse = False, incremental = False, precision = "float64",
+                 solver = None, tol = 1e-10, precondition = True, balance = False):
+        """
+        sparse = True, sparse SUT matrices and sparse LU (see Transform),
+                 the labelled tables (A, S, B*, L) and the matrices the 
+                 policies edit are dense DataFrames, so the memory is 
+                 only reduced in the transformation and the Leontief 
+                 factorization
+        incremental = True, scenario Leontief systems are solved as low-rank
+                      updates of the baseline factorization when policies
+                      only touch a few rows or columns of A
+        precision = "float32", matrices stored and Leontief systems solved 
+                    in float32 with q refined in float64 (see Transform),
+                    the error of the baseline and of each scenario against
+                    the float64 path is reported in self.error
+        solver = "gmres", "bicgstab" or "series", scenario Leontief systems
+                 are solved iteratively to the relative tolerance tol from
+                 the baseline q (see SUTops.iterative), Krylov solvers are
+                 preconditioned with the baseline factorization unless
+                 precondition = False, then nothing is factorized
+        balance = True, scenario intermediates and value added are GRAS 
+                  balanced to q_ after the policies (see balance_), 
+                  iterations and residuals are reported in self.balanced
+        
+        the baseline tables and Leontief factors are cached on disk as
+        they are computed (see dirs.base_cache, baseIOT), keyed by the 
+        SUT, the labels, the code and these options
+        """
+        
+        self.sparse = sparse
+        self.incremental = incremental
+        self.solver = solver
+        self.tol = tol
+        self.precondition = precondition and solver in ["gmres", "bicgstab"]
+        self.balance = balance
+        self.balanced = {}
+        self.L0 = None # baseline leontief system (incremental, y_only)
+        self.A0 = None # baseline A of L0
+        self.mult = {} # multipliers by scenario, block and codes
+        self.last = None # last scenario system (see system_)
+        self.digest = None # of the scenario plan of mult and last (see plan_)
         
-        self.SUTs = si.Transform(SUT)
+        self.regions = lb.regions # region blocks of the loaded SUT
+        self.n_va = lb.value_added()
+        self.error = {}
         
-        self.ap = Apply_policy()
+        self.ap = Apply_policy(self.regions)
         
         self.FD_EXT = si.Transform.FD_EXT
         
-        if method == 0:
-            self.IOT = self.SUTs.IOTpxpSTA_TCm()
-        elif method == 1:
-            self.IOT = self.SUTs.IOTpxpSTA_MSCm()
+        self.method = method
+        self.precision = precision
+        self.SUTs = None # Transform of the SUT, see transform_
+        self.IOT = None
+        
+        self.key = None
+        self.L_key = None # of the baseline leontief system, see base_leontief
+        self.base = None # cached baseline tables
+        if base_cache is not None:
+            self.key = base_cache.key(SUT, index, method = method, sparse = sparse, precision = precision)
+            self.base = base_cache.load(self.key)
+            
+            # iterative systems without preconditioner are not factorized
+            if solver is None or self.precondition:
+                self.L_key = base_cache.key(SUT, index, method = method, sparse = sparse, precision = precision,
+                                            solver = solver, tol = tol, precondition = self.precondition) + "-leontief"
+        
+        if self.base is None:
+            self.transform_()
+        else:
+            self.dtype = si.Transform.precisions[precision]
+            
+            if "error" in self.base:
+                self.error["baseline"] = self.base["error"]
     
+    def transform_(self):
+        """
+        IOT of the SUT (see SUTtoIOT), built once, when the baseline is
+        not cached or a table missing from the cache is first needed
+        
+        the factors of its Leontief system are cached (see baseIOT)
+        """
+        if self.SUTs is None:
+            self.SUTs = si.Transform(SUT, self.sparse, self.precision, self.n_va)
+            self.dtype = self.SUTs.dtype
+            
+            if self.method == 0:
+                self.IOT = self.SUTs.IOTpxpSTA_TCm()
+            elif self.method == 1:
+                self.IOT = self.SUTs.IOTpxpSTA_MSCm()
+            
+            if self.SUTs.error is not None:
+                self.error["baseline"] = self.SUTs.error
+            
+            have = {} if self.base is None else self.base
+            cached = {}
+            
+            # the sparse LU can not be stored
+            L = self.IOT["L"]
+            if L.factors() is not None and "lu" not in have:
+                cached["lu"], cached["piv"] = L.factors()
+                if self.dtype != np.float64:
+                    cached["LA"] = L.A # float64 A of the refinement
+            if "baseline" in self.error and "error" not in have:
+                cached["error"] = self.error["baseline"]
+            
+            if self.key is not None and cached:
+                base_cache.add(self.key, cached)
+        
+        return(self.IOT)
+    
+    def leontief0_(self):
+        """
+        Leontief system of the baseline IOT (L), from the cached factors
+        if there are
+        """
+        cached = {} if self.SUTs is not None or self.base is None else self.base
+        A = cached.get("LA", cached["A"].values if "A" in cached else None)
+        
+        if "lu" in cached and A is not None:
+            return(sops.leontief(A, self.dtype, lu = (cached["lu"], cached["piv"])))
+        
+        return(self.transform_()["L"])
     
+    @profiler.timed("baseIOT")
     def baseIOT(self):
         """
         method = 0 (Technical coefficient method)
                  1 (market share coefficient method)
                  
         baseline IOT calculated with Technical Coefficient method
+        
+        each table is computed and labelled on first access (see lazy),
+        then added to the cache of the baseline (see dirs.base_cache),
+        the Leontief inverse L is never cached, only its factors
         """
-
+        IOT = lambda: self.transform_()
+        cached = {} if self.base is None else self.base
         
-        E = self.IOT["E"]
-        RE = self.IOT["RE"]
-        L = self.IOT["L"]
-        S = self.IOT["S"]
-        q = self.IOT["q"]
-        A = self.IOT["A"]
-    
-        RBe = self.IOT["RBe"]
-        RBr = self.IOT["RBr"]
-        RBm = self.IOT["RBm"]
-    
-        Be = self.IOT["Be"]
-        Br = self.IOT["Br"]
-        Bm = self.IOT["Bm"]
-        ver_base = self.IOT["ver"]
-        
-        YBe = self.FD_EXT(self.SUTs.YBe, self.SUTs.diag_yj)
-        YBr = self.FD_EXT(self.SUTs.YBr, self.SUTs.diag_yj)
-        YBm = self.FD_EXT(self.SUTs.YBm, self.SUTs.diag_yj)
-    
-        L = lb._400x400(L)
-        S = lb._400x400(S)
-        A = lb._400x400(A)
-        RE = lb._E(RE)
-        
-        E = lb._E(E)
-    
-        RBe = lb._Be(lb._Rcol(RBe)) #extension coefficients
-        RYBe = lb._FD(lb._Be(YBe["RYB"])) # Final demand extension coefficients
-        YBe = lb._FD(lb._Be(YBe["YB"]))
-        Be = lb._Pr(lb._Be(Be))
-        
-        RBr = lb._Br(lb._Rcol(RBr))
-        RYBr = lb._FD(lb._Br(YBr["RYB"]))
-        YBr = lb._FD(lb._Br(YBr["YB"]))
-        Br = lb._Pr(lb._Br(Br))
-        
-        RBm = lb._Bm(lb._Rcol(RBm))
-        RYBm = lb._FD(lb._Bm(YBm["RYB"]))
-        YBm = lb._FD(lb._Bm(YBm["YB"]))
-        Bm = lb._Pr(lb._Bm(Bm))
-        
-        q = lb._Pr(q)
-        
-        ver_base = lb._Pr(ver_base)
-            
-        IOT = {"Y":self.SUTs.Y,
-               "L":L,
-               "A":A,
-               "S":S,
-               "q":q,
-               "RE": RE,
-               "E":E,
-               "YBe":YBe,
-               "YBr":YBr,
-               "YBm":YBm,
-               "RYBe":RYBe,
-               "RYBr":RYBr,
-               "RYBm":RYBm,
-               "RBe":RBe,
-               "RBr":RBr,
-               "RBm":RBm,
-               "Be":Be,
-               "Br":Br,
-               "Bm":Bm,
-               "ver":ver_base
-               }
+        base = LazyIOT(stage = "baseIOT")
         
-        return(IOT)
+        def define(k, fn):
+            if k in cached:
+                base[k] = cached[k]
+            elif self.key is None:
+                base.define(k, fn)
+            else:
+                base.define(k, lambda: self.cache_(k, fn()))
+        
+        base["Y"] = SUT["Y"]
+        base.define("L", lambda: lb._400x400(sops.astype(self.leontief0_().inv(), self.dtype)))
+        define("A", lambda: lb._400x400(IOT()["A"]))
+        define("S", lambda: lb._400x400(IOT()["S"]))
+        define("q", lambda: lb._Pr(IOT()["q"]))
+        define("RE", lambda: lb._E(IOT()["RE"]))
+        define("E", lambda: lb._E(IOT()["E"]))
+        
+        ext = {"e": lb._Be, "r": lb._Br, "m": lb._Bm}
+        
+        # final demand extensions and their coefficients
+        for M_name in ["YB", "RYB"]:
+            for l, label in ext.items():
+                define(M_name + l, lambda l = l, label = label, M_name = M_name: lb._FD(label(self.fd_ext_(l)[M_name])))
+        
+        # extension coefficients and extensions
+        for l, label in ext.items():
+            define("RB" + l, lambda l = l, label = label: label(lb._Rcol(IOT()["RB" + l])))
+        for l, label in ext.items():
+            define("B" + l, lambda l = l, label = label: lb._Pr(label(IOT()["B" + l])))
+        
+        define("ver", lambda: lb._Pr(IOT()["ver"]))
+        
+        return(base)
+    
+    def cache_(self, k, M):
+        """
+        Adds a baseline table to the cache once it is computed
+        """
+        base_cache.add(self.key, {k: M})
+        
+        return(M)
+    
+    def fd_ext_(self, l):
+        """
+        Final demand extensions and coefficients {"YB", "RYB"} of the
+        block l ("e", "r" or "m") in the precision of the IOT
+        """
+        self.transform_()
+        YB = self.FD_EXT(getattr(self.SUTs, "YB" + l), self.SUTs.diag_yj)
+        
+        if self.dtype != np.float64:
+            YB = {l: sops.astype(v, self.dtype) for l, v in YB.items()}
+        
+        return(YB)
           
+    def base_leontief(self, base):
+        """
+        Leontief system of the baseline A as sceneIOT derives it (S and Y)
+        so that scenario A_ differ from it only where policies apply
+        """
+        if self.L0 is None:
+            key = self.L_key
+            cached = None if key is None else base_cache.load(key)
+            
+            if cached is not None:
+                self.A0 = cached["A0"]
+                self.L0 = sops.leontief(self.A0.values, self.dtype, lu = (cached["lu"], cached["piv"]))
+                return(self.L0)
+            
+            inv_diag_q = sops.inv(sops.diag(sops.IOT.q(base["S"], base["Y"])))
+            A = sops.IOT.A(base["S"], inv_diag_q)
+            self.A0 = lb._400x400(A)
+            
+            if self.sparse:
+                A = sops.sparse(A)
+            
+            if self.solver is not None and not self.precondition:
+                self.L0 = sops.iterative(A, self.solver, self.tol)
+            else:
+                self.L0 = sops.IOT.L(A, self.dtype)
+            
+            # the sparse LU can not be stored
+            if key is not None and self.L0.factors() is not None:
+                lu, piv = self.L0.factors()
+                base_cache.save(key, {"A0": self.A0, "lu": lu, "piv": piv})
+            
+        return(self.L0)
+        
+    @staticmethod
+    def scen_(scen_no):
+        """
+        Scenario name, e.g. 1 => "scenario_1", "baseline" for the baseline
+        """
+        if scen_no in [0, "baseline", "base", None]:
+            return("baseline")
+        if type(scen_no) is int:
+            return("scenario_" + str(scen_no))
+        return(scen_no)
+    
+    def plan_(self):
+        """
+        Plan of the scenario file, the scenarios in mult and last are 
+        dropped when the content of the file changed
+        """
+        plan = scen_plan.load(scen_file, self.regions)
+        
+        if plan.digest != self.digest:
+            self.mult = {k: M for k, M in self.mult.items() if k[0] == "baseline"}
+            self.last = None
+            self.digest = plan.digest
+        
+        return(plan)
+    
+    def system_(self, scen, base):
+        """
+        Matrices (see policies_) and Leontief system of a scenario,
+        the last scenario is kept for the next call
+        """
+        if scen == "baseline":
+            return(base, self.base_leontief(base))
+        
+        self.plan_()
+        if self.last is None or self.last[0] != scen:
+            y_only = self.y_only(scen)
+            M = self.policies_(scen, base, y_only = y_only)
+            
+            with profiler.stage("leontief"):
+                L_ = self.base_leontief(base) if y_only else self.leontief_(M["A"], base)
+            
+            self.last = (scen, M, L_)
+        
+        return(self.last[1:])
+    
+    def codes_(self, index, codes):
+        """
+        Positions of the rows of index matching codes, all if None
+        """
+        if codes is None:
+            return(slice(None))
+        
+        n = np.arange(len(index))
+        
+        return(np.concatenate([n[self.ap.res.positions(index, c)] for c in codes]))
+    
+    @profiler.timed("multipliers", "scen_no", "ext")
+    def multipliers(self, scen_no = None, ext = "Be", codes = None, base = None):
+        """
+        Multipliers of an extension block (E, Be, Br or Bm)
+        M = R * L = (L' * R')', solved on the Leontief factors
+        
+        codes = extension codes (rows of the block), all by default
+        
+        cached by scenario, block and codes, a cached whole block
+        also gives the multipliers of any of its codes
+        """
+        if base is None:
+            base = self.baseIOT()
+        
+        scen = self.scen_(scen_no)
+        key = (scen, ext, None if codes is None else tuple(codes))
+        whole = (scen, ext, None)
+        
+        self.plan_()
+        
+        if key not in self.mult:
+            if whole in self.mult:
+                M = self.mult[whole]
+                return(M.iloc[self.codes_(M.index, codes)])
+            
+            IOT, L_ = self.system_(scen, base)
+            R = IOT["R" + ext]
+            R = R.iloc[self.codes_(R.index, codes)]
+            
+            M = L_.solve_T(np.asarray(R.values, dtype = float).T).T
+            self.mult[key] = pd.DataFrame(M, index = R.index, columns = lb.mi_("prod"))
+        
+        return(self.mult[key])
+    
+    @profiler.timed("footprints", "scen_no", "ext")
+    def footprints(self, scen_no = None, ext = "Be", codes = None, level = None, base = None):
+        """
+        Consumption-based footprints of final demand
+        F = M * Y + YB (see multipliers, E has no final demand extensions)
+        
+        rows are the extension codes, columns the final demand categories
+        of each region, level = a level of the columns of Y to sum them by
+        (e.g. "reg" footprints of each region, "abb" of each category)
+        """
+        if base is None:
+            base = self.baseIOT()
+        
+        scen = self.scen_(scen_no)
+        M = self.multipliers(scen, ext, codes, base)
+        
+        if scen == "baseline":
+            apply = lambda M_, M_name: M_
+        else:
+            apply = lambda M_, M_name: self.ap.apply_policy(scen, M_, M_name)
+        
+        Y_ = apply(base["Y"], "Y")
+        F = pd.DataFrame(M.values @ np.asarray(Y_.values, dtype = float), index = M.index, columns = Y_.columns)
+        
+        if ext != "E":
+            RYB = apply(base["RY" + ext], "RY" + ext)
+            RYB = RYB.iloc[self.codes_(RYB.index, codes)]
+            F += sops.fdext.YB(np.asarray(RYB.values, dtype = float), sops.diag(Y_.sum(axis = 0)))
+        
+        if level is not None:
+            F = F.T.groupby(level = level, sort = False).sum().T
+        
+        return(F)
+    
+    @profiler.timed("content", "scen_no")
+    def content(self, inputs, scen_no = None, demand = False, base = None):
+        """
+        Product content, amount of the input products embodied in the 
+        output of every product per unit of its final demand
+        C = L[inputs, :] = (L' * I[:, inputs])', one solve_T for all inputs
+        
+        inputs = products, regions or (product, region), e.g. ["C_STEL"]
+        demand = True, content of the final demand of each product
+                 C * diag(y)
+        """
+        if base is None:
+            base = self.baseIOT()
+        
+        if type(inputs) in [str, tuple]:
+            inputs = [inputs]
+        
+        IOT, L_ = self.system_(self.scen_(scen_no), base)
+        
+        index = lb.mi_("prod")
+        pos = np.arange(len(index))[self.codes_(index, inputs)]
+        
+        I = np.zeros((len(index), len(pos)))
+        I[pos, np.arange(len(pos))] = 1
+        
+        C = L_.solve_T(I).T
+        
+        if demand:
+            C = sops.diag(np.asarray(np.sum(IOT["Y"], axis = 1), dtype = float)).cols(C)
+        
+        return(pd.DataFrame(C, index = index[pos], columns = index))
+    
+    @profiler.timed("sceneIOT", "scen_no")
     def sceneIOT(self, scen_no, base = None):
         """
         baseline IOT calculated with Technical Coefficient or Market coefficient method
@@ -126,84 +428,172 @@ class Base_n_scen:
         
         if base == None:
             base = self.baseIOT()
-            
-        #A_ = base["A"].copy(True)
-        Y_ = base["Y"].copy(True)
-        S_ = base["S"].copy(True)
-        RE_ = base["RE"].copy(True)    
-        #ver_base_ = base["ver"].copy(True)      
-        RBe_ = base["RBe"].copy(True)
-        RBr_ = base["RBr"].copy(True)
-        RBm_ = base["RBm"].copy(True)
-        Be_ = base["Be"].copy(True)
-        Br_ = base["Br"].copy(True)
-        Bm_ = base["Bm"].copy(True)        
-        RYBe_ = base["RYBe"].copy(True)
-        RYBr_ = base["RYBr"].copy(True)
-        RYBm_ = base["RYBm"].copy(True)
-        
-        # Apply policy to economic matrices
-        S_ = self.ap.apply_policy(scen_no, S_, "S")
-    
-        inv_diag_q_ = sops.inv(np.diag(sops.IOT.q(S_,Y_)))
-        
-        A_ = sops.IOT.A(S_, inv_diag_q_ )
-
-        A_ = lb._400x400(A_)
-        A_ = self.ap.apply_policy(scen_no, A_, "A")
         
-        Y_ = self.ap.apply_policy(scen_no, Y_, "Y")
-
-        RE_ = lb._E(RE_)    
-        RE_ = self.ap.apply_policy(scen_no, RE_, "RE")
-            
-            
-        # Apply policy to intermediate extension coefficient matrices
-        RBe_ = self.ap.apply_policy(scen_no, RBe_, "RBe")
-        RBr_ = self.ap.apply_policy(scen_no, RBr_, "RBr")
-        RBm_ = self.ap.apply_policy(scen_no, RBm_, "RBm")
-       
-        # Apply policy to  final demand extension coefficient matrices
-        RYBe_ = self.ap.apply_policy(scen_no, RYBe_, "RYBe")
-        RYBr_ = self.ap.apply_policy(scen_no, RYBr_,"RYBr")
-        RYBm_ = self.ap.apply_policy(scen_no, RYBm_, "RYBm")  
+        # final demand only, A_ is the baseline A (see y_only)
+        y_only = self.y_only(scen_no)
+        
+        M = self.policies_(scen_no, base, y_only = y_only)
         
         # Scenario
-      
-        L_ = sops.IOT.L(A_) # total product output according to full scenario with S and Y modified
+        with profiler.stage("leontief"):
+            if y_only:
+                L_ = self.base_leontief(base)
+            else:
+                L_ = self.leontief_(M["A"], base)
+            q_ = sops.IOT.q_IAy(L_, np.sum(M["Y"], axis = 1))
         
-        yi_ = np.sum(Y_, axis = 1)
-        diag_yj_ = np.diag(Y_.sum(axis = 0))
-        q_ = sops.IOT.q_IAy(L_, yi_)
-        diag_q_ = np.diag(q_)
-        S_ = sops.IOT.S(A_, diag_q_)        
-   
-        E_ = sops.IOT.B(RE_, diag_q_) # primary inputs
+        self.plan_()
+        self.last = (self.scen_(scen_no), M, L_) # reused by multipliers
         
-        Be_ = sops.IOT.B(RBe_, diag_q_) # environmental ext
-        Br_ = sops.IOT.B(RBr_, diag_q_) # resource ext
-        Bm_ = sops.IOT.B(RBm_, diag_q_) # material ext
+        return(self.build_(scen_no, M, q_, L_))
+    
+    def y_only(self, scen_no):
+        """
+        True if the scenario only intervenes on final demand (Y and RYB*)
+        """
+        if type(scen_no) is int:
+            scen_no = "scenario_" + str(scen_no)
         
-        YBe_ = sops.fdext.YB(RYBe_, diag_yj_) # environmental ext
-        YBr_ = sops.fdext.YB(RYBr_, diag_yj_) # resource ext
-        YBm_ = sops.fdext.YB(RYBm_, diag_yj_) # material ext
+        plan = self.plan_()
         
-        # labelling
+        return(set(plan.matrices(scen_no)) <= set(self.fd_matrices))
     
-        S = lb._400x400(S_)
-        E = lb._E(E_)
-        Y = lb._Y(Y_)
+    @profiler.timed("y_onlyIOT")
+    def y_onlyIOT(self, scens, base = None):
+        """
+        IOTs of final demand only scenarios (see y_only), their final 
+        demands are stacked and solved together on the baseline factors
+        Q = L @ [y_1, ..., y_k]
+        """
+        if base == None:
+            base = self.baseIOT()
+        
+        Ms = [self.policies_(n, base, y_only = True) for n in scens]
         
-        Be = lb._Pr(lb._Be(Be_))
-        Bm = lb._Pr(lb._Bm(Bm_))   
-        Br = lb._Pr(lb._Br(Br_))
+        with profiler.stage("leontief"):
+            L0 = self.base_leontief(base)
+            Q = L0 @ np.column_stack([np.sum(M["Y"], axis = 1) for M in Ms])
+        
+        return([self.build_(n, M, Q[:, c], L0) for c, (n, M) in enumerate(zip(scens, Ms))])
+    
+    def policies_(self, scen_no, base, apply = None, y_only = False):
+        """
+        Scenario coefficient matrices and final demand after the policy
+        interventions (A, Y, RE, RB*, RYB*)
+        
+        apply(M, M_name) = applies the policies on a matrix, by default
+                           those of scen_no in the scenario file
+        y_only = True, the scenario only changes final demand, A_ is the
+                 baseline A and is not derived again from S and Y
+        """
+        if apply is None:
+            apply = lambda M, M_name: self.ap.apply_policy(scen_no, M, M_name)
         
-        YBm = lb._FD(lb._Bm(YBm_))
-        YBr = lb._FD(lb._Br(YBr_))
-        YBe = lb._FD(lb._Be(YBe_))
+        # copy-on-write: baseline matrices are shared read-only and
+        # apply_policy returns a new matrix only for those the scenario
+        # intervenes on, B* are recalculated from q_ anyway
+        Y_ = base["Y"]
         
-        ver = sops.verifyIOT(S_, Y_, E_) # ver_new_IOT
-        ver = lb._Pr(ver)
+        if y_only:
+            self.base_leontief(base)
+            A_ = self.A0
+        else:
+            # Apply policy to economic matrices
+            S_ = apply(base["S"], "S")
+        
+            inv_diag_q_ = sops.inv(sops.diag(sops.IOT.q(S_,Y_)))
+            
+            A_ = sops.IOT.A(S_, inv_diag_q_ )
+    
+            A_ = apply(lb._400x400(A_), "A")
+        
+        M = LazyIOT({"A": A_,
+                     "Y": apply(Y_, "Y")
+                     }, stage = "policies")
+        
+        # Apply policy to primary input, intermediate and final demand 
+        # extension coefficient matrices when build_ needs them
+        M.define("RE", lambda: apply(lb._E(base["RE"]), "RE"))
+        for l in ["RBe", "RBr", "RBm", "RYBe", "RYBr", "RYBm"]:
+            M.define(l, lambda l = l: apply(base[l], l))
+        
+        return(M)
+    
+    def leontief_(self, A_, base):
+        """
+        Leontief system of a scenario A_
+        """
+        if self.solver is not None:
+            M = self.base_leontief(base) if self.precondition else None
+            A_ = sops.sparse(A_) if self.sparse else A_
+            L_ = sops.iterative(A_, self.solver, self.tol, M = M, x0 = base["q"]) # warm start from baseline q
+        elif self.incremental:
+            L_ = self.base_leontief(base).update(A_) # low-rank update
+        elif self.sparse:
+            L_ = sops.IOT.L(sops.sparse(A_), self.dtype) # sparse LU
+        else:
+            L_ = sops.IOT.L(A_, self.dtype) # total product output according to full scenario with S and Y modified
+        
+        return(L_)
+    
+    def build_(self, scen_no, M, q_, L_ = None):
+        """
+        Labelled scenario IOT from the scenario matrices (see policies_)
+        and the total product output q_
+        
+        each table is computed and labelled on first access (see lazy),
+        extensions can also give only the rows of some extension codes
+        """
+        A_ = M["A"]
+        Y_ = M["Y"]
+        
+        yi_ = np.sum(Y_, axis = 1)
+        diag_yj_ = sops.diag(Y_.sum(axis = 0))
+        diag_q_ = sops.diag(q_)
+        
+        # low precision storage (see Transform.precision_)
+        if self.dtype != np.float64:
+            stored = lambda m: sops.astype(m, self.dtype)
+        else:
+            stored = lambda m: m
+        
+        S_ = lambda: sops.IOT.S(A_, diag_q_) # intermediates
+        E_ = lambda: sops.IOT.B(M["RE"], diag_q_) # primary inputs
+        E_rows = lambda x: self.rows_(M["RE"], x, diag_q_.cols, stored, "prod")
+        
+        if self.balance:
+            S_b, E_b = self.balance_(scen_no, S_(), E_(), yi_, q_)
+            S_, E_, E_rows = (lambda: S_b), (lambda: E_b), None
+        
+        if self.dtype != np.float64:
+            # error against the float64 tables (see Transform.precision_)
+            S_64, E_64 = S_(), E_()
+            ver = sops.verifyIOT(S_64, Y_, E_64, self.n_va)
+            S_, E_ = (lambda: S_64), (lambda: E_64)
+        
+        IOT = LazyIOT(stage = "build")
+        
+        IOT.define("Y", lambda: lb._Y(Y_))
+        IOT.define("S", lambda: lb._400x400(stored(S_())))
+        IOT.define("E", lambda: lb._E(stored(E_())), rows = E_rows)
+        
+        # environmental, resource and material ext
+        ext = {"e": lb._Be, "r": lb._Br, "m": lb._Bm}
+        for l, label in ext.items():
+            IOT.define("B" + l, lambda l = l, label = label: lb._Pr(label(stored(sops.IOT.B(M["RB" + l], diag_q_)))),
+                       rows = lambda x, l = l: self.rows_(M["RB" + l], x, diag_q_.cols, stored, "prod"))
+        for l, label in ext.items():
+            IOT.define("YB" + l, lambda l = l, label = label: lb._FD(label(stored(sops.fdext.YB(M["RYB" + l], diag_yj_)))),
+                       rows = lambda x, l = l: self.rows_(M["RYB" + l], x, diag_yj_.cols, stored, "Y"))
+        
+        IOT.define("ver", lambda: lb._Pr(sops.verifyIOT(IOT["S"], Y_, IOT["E"], self.n_va))) # ver_new_IOT
+        
+        if self.dtype != np.float64:
+            self.error[scen_no] = {"dtype": np.dtype(self.dtype).name,
+                                   "iterations": getattr(L_, "iterations", None),
+                                   "residual": sops.residual(A_, yi_, q_),
+                                   "ver_error": float(np.abs(sops.verifyIOT(IOT["S"], Y_, IOT["E"], self.n_va) - ver).max())
+                                   }
         
 #==============================================================================
 #         # Uncomment to check both base and scenario balance
@@ -212,17 +602,56 @@ class Base_n_scen:
 #                "ver2":ver
 #                 }
 #==============================================================================
-        
-        IOT = {"Y":Y,
-               "S":S,
-               "E":E,
-               "Be":Be,
-               "Br":Br,
-               "Bm":Bm,
-               "YBe":YBe,
-               "YBr":YBr,
-               "YBm":YBm,
-               "ver":ver
-               }
                    
-        return(IOT)    
\ No newline at end of file
+        return(IOT)
+    
+    @profiler.timed("balance", "scen_no")
+    def balance_(self, scen_no, S_, E_, yi_, q_):
+        """
+        GRAS balancing of intermediates and value added after the policies
+        (see SUTops.gras), q_ and final demand are kept
+            rows: S_ + Y_ = q_, value added rows keep their share of the
+                  total value added = total final demand
+            columns: S_ + value added = q_
+        iterations and residual are reported in self.balanced
+        """
+        S = np.asarray(S_, dtype = float)
+        E = np.asarray(E_, dtype = float)
+        y = np.asarray(yi_, dtype = float)
+        q = np.asarray(q_, dtype = float)
+        n = len(S)
+        
+        va = E[:self.n_va].sum(axis = 1)
+        u = np.concatenate([q - y, va * y.sum() / va.sum()])
+        
+        X0 = np.vstack([S, E[:self.n_va]])
+        if self.sparse:
+            X0 = sops.sparse(X0)
+        
+        g = sops.gras(X0, u, q, self.tol)
+        X = g.X.toarray() if self.sparse else g.X
+        
+        self.balanced[scen_no] = {"iterations": g.iterations,
+                                  "residual": g.residual,
+                                  "converged": g.converged
+                                  }
+        if not g.converged:
+            warn.warn("GRAS did not converge for " + str(scen_no) + ", residual " + str(g.residual))
+        
+        E = E.copy()
+        E[:self.n_va] = X[n:]
+        
+        return(pd.DataFrame(X[:n], index = S_.index, columns = S_.columns), 
+               pd.DataFrame(E, index = E_.index, columns = E_.columns))
+    
+    def rows_(self, R, x, cols, stored, columns):
+        """
+        Rows of the extensions R * diag matching x (e.g. an extension code)
+        calculated on those rows of the coefficients R only
+        """
+        pos = self.ap.res.positions(R.index, x)
+        
+        B = df(stored(cols(R.iloc[pos])))
+        B.columns = lb.mi_(columns)
+        
+        return(B)
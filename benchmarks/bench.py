@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Description: Times each stage of the model on synthetic multi-regional SUTs
+             of increasing size (see synthetic.py)
+
+             python benchmarks/bench.py --sizes 50 100 200 --json bench.json
+
+             each size runs in its own process so that the module level
+             data of dirs, labels and results is built for that size only
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import warnings as warn
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+sys.path.insert(0, here)
+
+import synthetic
+
+
+def best_of(fn, repeat):
+    """
+    Minimum wall time of fn over repeat runs and the last output
+    """
+    times = []
+    for r in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t)
+
+    return(min(times), out)
+
+
+def materialised(IOT):
+    """
+    Every table of a lazy IOT computed (see lazy), so that a stage is
+    timed with the tables it builds and not only their definitions
+    """
+    return(dict(IOT.items()))
+
+
+def run_case(paths, method, repeat, out_dir, report = None):
+    """
+    Times each stage on a synthetic case, dirs is pointed at the case
+    before any module reading it is imported
+
+    the stages so far are written to report after each stage, a failing
+    stage stops the run with its error
+    """
+    import dirs
+    from sut_store import Store
+
+    dirs.SUT = Store(os.path.splitext(paths["SUT"])[0], paths["SUT"])
+    dirs.BP = dirs.SUT
+    dirs.index = paths["index"]
+    dirs.scen_file = paths["scen_file"]
+    dirs.base_cache = None # every run transforms the SUT
+    list(dirs.SUT.values()) # one-time conversion, not timed
+
+    stages = []
+    def timed(stage, fn, n = repeat):
+        seconds, out = best_of(fn, n)
+        stages.append({"stage": stage, "seconds": seconds})
+        if report is not None:
+            json.dump(stages, open(report, "w"))
+        return(out)
+
+    timed("import", lambda: __import__("results"), 1)
+    import SUTtoIOT as si
+    from results import Results
+    from save_ import Save
+
+    SUTs = timed("Transform", lambda: si.Transform(dirs.SUT))
+    timed("Transform.IOTpxpSTA_TCm", lambda: materialised(SUTs.IOTpxpSTA_TCm()))
+    timed("Transform.IOTpxpSTA_MSCm", lambda: materialised(SUTs.IOTpxpSTA_MSCm()))
+
+    res = timed("Results", lambda: Results(method), 1)
+    gr = res.gr
+    # the tables of the transformed IOT are kept once computed, so the
+    # baseline is only timed once
+    base = timed("Base_n_scen.baseIOT", lambda: materialised(gr.bns.baseIOT()), 1)
+
+    for scen in gr.sheets:
+        for M_name in gr.plan.matrices(scen):
+            if M_name in base:
+                timed("Apply_policy.apply_policy " + scen + " " + M_name,
+                      lambda: gr.bns.ap.apply_policy(scen, base[M_name], M_name))
+
+    scenes = {"baseline": base}
+    for scen in gr.sheets:
+        scenes[scen] = timed("Base_n_scen.sceneIOT " + scen, lambda: materialised(gr.bns.sceneIOT(scen, base)))
+
+    for scen, IOT in scenes.items():
+        timed("GatherResults.iter_thru_for_results " + scen, lambda: gr.iter_thru_for_results(IOT, scen))
+
+    scene = scenes[gr.sheets[0]]
+    for fmt in Save.formats:
+        save = Save(os.path.join(out_dir, fmt) + "/", method, fmt)
+        timed("Save.save_ " + fmt, lambda: save.save_(scene, gr.sheets[0]), 1)
+
+    return(stages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark on synthetic MRSUTs")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [50, 100, 200], help = "products per region")
+    parser.add_argument("--ind_share", type = float, default = 0.8, help = "industries per product")
+    parser.add_argument("--regions", nargs = "+", default = ["EU", "ROW"])
+    parser.add_argument("--fd", type = int, default = 7, help = "final demand categories per region")
+    parser.add_argument("--ext", type = int, nargs = 3, default = [170, 284, 15], help = "rows of Be, Bm, Br")
+    parser.add_argument("--density", type = float, default = 0.1)
+    parser.add_argument("--method", type = int, nargs = "+", default = [0])
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--json", default = None, help = "write all timings to this file")
+    parser.add_argument("--case", default = None, help = argparse.SUPPRESS)
+    parser.add_argument("--report", default = None, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        warn.simplefilter("ignore")
+        paths = json.load(open(os.path.join(args.case, "paths.json")))
+        run_case(paths, args.method[0], args.repeat, args.case, args.report)
+        return
+
+    report = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as case:
+            n_ind = max(1, int(size * args.ind_share))
+            spec = {"n_prod": size, "n_ind": n_ind, "n_fd": args.fd,
+                    "n_Be": args.ext[0], "n_Bm": args.ext[1], "n_Br": args.ext[2],
+                    "regions": args.regions, "density": args.density}
+            paths = synthetic.write_case(case, **spec)
+            json.dump(paths, open(os.path.join(case, "paths.json"), "w"))
+
+            for method in args.method:
+                out = os.path.join(case, "stages.json")
+                code = subprocess.call([sys.executable, os.path.abspath(__file__),
+                                        "--case", case, "--report", out,
+                                        "--method", str(method), "--repeat", str(args.repeat)],
+                                       stdout = subprocess.DEVNULL)
+
+                stages = json.load(open(out)) if os.path.exists(out) else []
+                if os.path.exists(out):
+                    os.remove(out)
+
+                for s in stages:
+                    s.update(spec, method = method, products = size * len(args.regions))
+                    report.append(s)
+                    print(str(size).rjust(6), str(method), s["stage"].ljust(60), "%.4f" % s["seconds"])
+
+                # the timings so far are kept when a run fails
+                if args.json is not None:
+                    json.dump(report, open(args.json, "w"), indent = 1)
+
+                if code != 0:
+                    sys.exit("Benchmark failed for size " + str(size) + " method " + str(method) + " (exit status " + str(code) + "), see the error above")
+
+
+if __name__ == "__main__":
+    main()
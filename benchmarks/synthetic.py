@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Description: Balanced synthetic multi-regional SUTs with matching index and
+             scenario workbooks for benchmarking
+"""
+import os
+import pickle as pk
+import numpy as np
+import pandas as pd
+
+n_va = 9 # value added rows in E, codes w.. (see Labels.value_added)
+
+
+def names(prefix, n):
+    return([prefix + str(i).zfill(3) for i in range(n)])
+
+
+def index_tables(n_prod, n_ind, n_fd, n_E, n_Be, n_Bm, n_Br, regions):
+    """
+    Label sheets of index.xls for a synthetic system
+    """
+    def sheet(prefix, n, code, unit = None):
+        t = pd.DataFrame({"Code": names(code, n),
+                          "Name": [prefix + " " + str(i) for i in range(n)],
+                          "Synonym": names(prefix + "_", n)})
+        if unit is not None:
+            t["Unit"] = unit
+        return(t)
+
+    E = sheet("V", n_E, "w", "M.EUR")
+    E.loc[n_va:, "Synonym"] = names("X_", n_E - n_va)
+    E.loc[n_va:, "Code"] = names("z", n_E - n_va)
+
+    tables = {"countries": pd.DataFrame({"CountryCode": names("R", len(regions)),
+                                         "CountryName": regions,
+                                         "CountryGroup": regions}),
+              "Products": sheet("C", n_prod, "p", "dimensionless"),
+              "Industries": sheet("A", n_ind, "i"),
+              "Y": sheet("F", n_fd, "y"),
+              "E": E,
+              "Be": sheet("E", n_Be, "b", "kg"),
+              "Bm": sheet("M", n_Bm, "M_", "t")[["Code", "Name", "Unit"]],
+              "Br": sheet("L", n_Br, "L_")[["Code", "Name"]]
+              }
+
+    return(tables)
+
+
+def mrsut(n_prod, n_ind, n_fd, n_E, n_Be, n_Bm, n_Br, regions, density = 0.1, seed = 0):
+    """
+    Balanced multi-regional SUT: rows of V and U are products of each region,
+    columns industries of each region, so that q = rowsum(U) + rowsum(Y)
+    and g = colsum(U) + colsum(E[:n_va])
+
+    density = share of non-zero intermediate transactions and extensions
+    """
+    rng = np.random.default_rng(seed)
+    r = len(regions)
+    npr, nin, nfd = n_prod * r, n_ind * r, n_fd * r
+
+    # every industry has a main product and some secondary production
+    V = np.zeros((npr, nin))
+    V[np.arange(nin) % npr, np.arange(nin)] = rng.uniform(50, 100, nin)
+    V += (rng.random((npr, nin)) < density / 10) * rng.uniform(0, 5, (npr, nin))
+    missing = V.sum(axis = 1) == 0
+    V[missing, rng.integers(0, nin, missing.sum())] = rng.uniform(1, 10, missing.sum())
+
+    q = V.sum(axis = 1)
+    g = V.sum(axis = 0)
+
+    # intermediate use below 80% of both product and industry output
+    U = np.outer(q, g) * rng.uniform(0, 2, (npr, nin)) * (rng.random((npr, nin)) < density)
+    U *= 0.5 * q.sum() / max(U.sum(), 1e-12)
+    for _ in range(2):
+        over = U.sum(axis = 1) > 0.8 * q # only rows with some use are divided
+        U[over] *= (0.8 * q[over] / U[over].sum(axis = 1))[:, None]
+        over = U.sum(axis = 0) > 0.8 * g
+        U[:, over] *= 0.8 * g[over] / U[:, over].sum(axis = 0)
+
+    Y = (q - U.sum(axis = 1))[:, None] * rng.dirichlet(np.ones(nfd), npr)
+    va = g - U.sum(axis = 0)
+    E = np.vstack([va * rng.dirichlet(np.ones(n_va), nin).T,
+                   rng.uniform(0, 10, (n_E - n_va, nin))])
+
+    def ext(n, cols):
+        return(pd.DataFrame(rng.uniform(0, 1, (n, cols)) * (rng.random((n, cols)) < density)))
+
+    t = index_tables(n_prod, n_ind, n_fd, n_E, n_Be, n_Bm, n_Br, regions)
+
+    def mi(sheet):
+        labels = pd.concat([t[sheet].assign(Region = reg) for reg in regions], ignore_index = True)
+        labels = labels[["Synonym", "Region", "Code", "Name"]]
+        return(pd.MultiIndex.from_arrays(labels.values.T, names = ["abb", "reg", "code", "name"]))
+
+    SUT = {"V": V,
+           "U": U,
+           "Y": pd.DataFrame(Y, index = mi("Products"), columns = mi("Y")),
+           "Tm": np.zeros((npr, nin)),
+           "E": E,
+           "Be": ext(n_Be, nin),
+           "YBe": ext(n_Be, nfd),
+           "Br": ext(n_Br, nin),
+           "YBr": ext(n_Br, nfd),
+           "Bm": ext(n_Bm, nin),
+           "YBm": ext(n_Bm, nfd)
+           }
+
+    return(SUT, t)
+
+
+def targets(SUT, n_prod, n_ind, n_fd):
+    """
+    Products and extension row of the scenarios, chosen on non-zero cells
+    of the first region so that every policy changes the tables:
+    a product s made by industry s (its main product) with three inputs
+    i1, i2, i3 (U[i, s] > 0) and a row r of Be with Be[r, s] > 0 and
+    final demand extensions YBe[r] in the region
+    """
+    U = np.asarray(SUT["U"])[:n_prod, :n_ind]
+    Be = np.asarray(SUT["Be"])[:, :n_ind]
+    YBe = np.asarray(SUT["YBe"])[:, :n_fd]
+
+    for s in range(n_ind):
+        inputs = [i for i in np.flatnonzero(U[:, s]) if i != s]
+        rows = np.flatnonzero((Be[:, s] > 0) & (YBe.sum(axis = 1) > 0))
+        if len(inputs) >= 3 and len(rows) > 0:
+            return({"s": s, "i1": inputs[0], "i2": inputs[1], "i3": inputs[2], "r": rows[0]})
+
+    raise ValueError("No product with three inputs and extensions in the first region, increase the density")
+
+
+def scenario_tables(t, regions, SUT):
+    """
+    Scenario sheets touching S, A, Y and extensions plus the analyse sheet,
+    on non-zero cells of SUT (see targets)
+    """
+    cols = ["matrix", "identifier", "intervention", "reg_A1", "reg_A2", "reg_B1", "reg_B2",
+            "catA", "stageA", "catB", "stageB", "expansion", "life", "share", "recycle",
+            "l_kp", "s_kp", "r_kp", "fx_kp"]
+    N = np.nan
+    P = list(t["Products"]["Synonym"])
+    F = list(t["Y"]["Synonym"])
+    Be = list(t["Be"]["Synonym"])
+    Bm = list(t["Bm"]["Code"])
+    a, b = regions[0], regions[-1]
+
+    x = targets(SUT, len(P), len(t["Industries"]), len(F))
+    stage, in1, in2, in3 = [P[x[k]] for k in ["s", "i1", "i2", "i3"]]
+    e1, e2 = Be[x["r"]], Be[(x["r"] + 1) % len(Be)]
+
+    scenarios = {
+        "scenario_1": [
+            ["S", 1, "direct", a, a, N, N, in1, stage, N, N, N, 20, 10, 30, 50, 40, 60, N],
+            ["S", 2, "indirect", a, a, a, a, in1, stage, in2, stage, N, 20, N, N, 50, N, N, 80],
+            ["S", 3, "expansion", b, N, N, N, stage, N, N, N, 15, N, N, N, N, N, N, N],
+            ["A", 4, "direct", a, a, N, N, in3, stage, N, N, N, 10, N, N, 100, N, N, N],
+            ["Y", 5, "direct", a, a, N, N, stage, N, N, N, N, 30, N, N, 50, N, N, N],
+            ["Y", 6, "indirect", a, a, a, a, stage, N, in2, N, N, 30, N, N, 50, N, N, 40],
+            ["RBe", 7, "direct", N, a, N, N, e1, stage, N, N, N, 10, N, N, 100, N, N, N],
+            ["RYBe", 8, "expansion", N, a, N, N, e1, N, N, N, -20, N, N, N, N, N, N, N]],
+        "scenario_2": [
+            ["Y", 1, "direct", a, a, N, N, stage, N, N, N, N, 30, N, N, 50, N, N, N],
+            ["Y", 2, "expansion", b, N, N, N, in3, N, N, N, 10, N, N, N, N, N, N, N],
+            ["RYBe", 3, "direct", N, a, N, N, e1, N, N, N, N, 10, N, N, 100, N, N, N]],
+        "scenario_3": [
+            ["S", 1, "direct", a, a, N, N, in1, stage, N, N, N, 20, N, N, 50, N, N, N]]
+        }
+
+    tables = {}
+    for sheet, rows in scenarios.items():
+        s = pd.DataFrame(rows, columns = cols)
+        s.insert(0, "Focus", N)
+        tables[sheet] = s
+
+    analyse = pd.DataFrame({"matrix": ["Be", "YBe", "Be", "E", "Bm"],
+                            "ext": [e1, e1, e2, t["E"]["Synonym"][0], Bm[0]],
+                            "stageA": [N, N, stage, stage, N],
+                            "stageB": [N, N, stage, stage, N],
+                            "regA": [a, a, a, a, b],
+                            "regB": [a, a, a, a, b],
+                            "Note": [N] * 5})
+
+    return(tables, analyse)
+
+
+def write_case(directory, n_prod = 50, n_ind = 40, n_fd = 7, n_E = 19,
+               n_Be = 20, n_Bm = 20, n_Br = 15, regions = ["EU", "ROW"],
+               density = 0.1, seed = 0):
+    """
+    Writes a synthetic case in directory: SUTs/mrSUT.pkl, index.xlsx and
+    scenarios.xlsx, returns their paths
+    """
+    SUT, t = mrsut(n_prod, n_ind, n_fd, n_E, n_Be, n_Bm, n_Br, regions, density, seed)
+    scenarios, analyse = scenario_tables(t, regions, SUT)
+
+    paths = {"SUT": os.path.join(directory, "SUTs", "mrSUT.pkl"),
+             "index": os.path.join(directory, "index.xlsx"),
+             "scen_file": os.path.join(directory, "scenarios.xlsx")}
+
+    os.makedirs(os.path.dirname(paths["SUT"]), exist_ok = True)
+    with open(paths["SUT"], "wb") as f:
+        pk.dump(SUT, f)
+
+    with pd.ExcelWriter(paths["index"]) as w:
+        for sheet, table in t.items():
+            table.to_excel(w, sheet_name = sheet, index = False)
+
+    write_scenarios(paths["scen_file"], scenarios, analyse)
+
+    return(paths)
+
+
+def write_scenarios(path, scenarios, analyse):
+    """
+    Scenario workbook from the tables of scenario_tables
+    """
+    with pd.ExcelWriter(path) as w:
+        analyse.to_excel(w, sheet_name = "analyse", index = False)
+        for sheet, table in scenarios.items():
+            pd.DataFrame([[sheet]]).to_excel(w, sheet_name = sheet, header = False, index = False)
+            table.to_excel(w, sheet_name = sheet, startrow = 1, index = False)
@@ -9,10 +9,15 @@ Scope: MSc research Modelling circular economy policies in EEIOA
 @author: Franco Donati
 @institution: Leiden University CML, TU Delft TPM
 """
-import pickle as pk
+from sut_store import Store
+from base_cache import Cache
 
-SUT = pk.load(open("SUTs/mrSUT_EU_ROW.pkl", "rb"))
-BP = pk.load(open("SUTs/BP.pkl", "rb"))
+# converted once from the pickles, then memory-mapped on first access
+SUT = Store("SUTs/mrSUT_EU_ROW", "SUTs/mrSUT_EU_ROW.pkl")
+BP = Store("SUTs/BP", "SUTs/BP.pkl")
+
+# transformed baselines, None to always transform the SUT again
+base_cache = Cache("SUTs/cache", max_bytes = 10 * 2**30)
 
 scen_file = "scenarios.xls"
 
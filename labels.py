@@ -9,19 +9,73 @@ Scope: MSc research Modelling circular economy policies in EEIOA
 @author:Franco Donati
 @institution:Leiden University CML, TU Delft TPM
 """
-from pandas import DataFrame as df
+from pandas import DataFrame
 from pandas import MultiIndex as mi
 import pandas as pd
+import numpy as np
 from dirs import index as f
+from dirs import SUT
+import sut_store
 from pandas import read_excel as re
+import profiler
+
+
+def df(matrix):
+    """
+    DataFrame of a matrix, sparse matrices are made dense for labelling
+    and DataFrames are shallow copies, so relabelling never changes the
+    labels of a matrix shared with the baseline
+    """
+    if hasattr(matrix, "toarray"):
+        matrix = matrix.toarray()
+    elif isinstance(matrix, DataFrame):
+        return(matrix.copy(False))
+    
+    return(DataFrame(matrix))
+
+
+_sheets = {} # index.xls sheets, read once per process
+_mis = {} # MultiIndex of each label set and regions, built once per process
+
+
+def read_index(f):
+    """
+    Sheets of index.xls as DataFrames (read only the first time)
+    """
+    if f not in _sheets:
+        with profiler.stage("read index.xls"):
+            _sheets[f] = re(f, None)
+    
+    return(_sheets[f])
+
 
 class Labels:
     
-    def __init__(self):
+    # label set => (attribute with the labels, level names)
+    names = {"prod":("prodER", ["abb","reg","code","name"]),
+             "ind":("indER", ["abb","reg","code","name"]),
+             "Y":("YER", ["abb","reg","code","name"]),
+             "E":("E", ["abb","reg","code","name"]),
+             "prod_Rcol":("prodER", ["abb","code","name", "reg"]),
+             "ind_Rcol":("indER", ["abb","code","name", "reg"]),
+             "prod_short":("prod", ["abb","code","name"]),
+             "Bm":("Bm", ["abb", "name", "unit"]),
+             "Be":("Be", ["abb","code","name","unit"]),
+             "Br":("Br", ["abb","name"])
+             }
+    
+    def __init__(self, regions = None):
         """
         country and region labels
+        
+        regions = regions in the order of the region blocks of the tables,
+                  by default those of the loaded SUT (see sut_store.regions)
         """
-        co_in = re(f,"countries", 0)
+        self._regions = regions
+        
+        sheets = read_index(f)
+        
+        co_in = sheets["countries"]
         self.CI = co_in[["CountryName","CountryCode","CountryGroup"]]
         
         self.eu = (self.CI[self.CI["CountryGroup"]=="EU"])
@@ -29,13 +83,13 @@ class Labels:
         self.EUcc = self.eu[["CountryGroup","CountryCode"]] #selected list of country codes for EU
         self.ROWcc = self.row[["CountryGroup","CountryCode"]] #selected list of country codes for ROW
             
-        ind_ = re(f,"Industries")
-        prod_ = re(f,"Products")
-        Be_ = re(f,"Be")
-        Y_ = re(f,"Y")
-        E_ = re(f,"E")
-        Bm_ = re(f,"Bm")
-        Br_ = re(f,"Br")
+        ind_ = sheets["Industries"]
+        prod_ = sheets["Products"]
+        Be_ = sheets["Be"]
+        Y_ = sheets["Y"]
+        E_ = sheets["E"]
+        Bm_ = sheets["Bm"]
+        Br_ = sheets["Br"]
         
         self.ind = ind_.loc[:,["Synonym","Code","Name"]]
         self.prod = prod_.loc[:,["Synonym","Code","Name"]]
@@ -45,191 +99,362 @@ class Labels:
         self.Bm = Bm_.loc[:,["Code","Name","Unit"]]
         self.Br = Br_.loc[:,["Code","Name"]]
         
+        self.indER = None
+        self.prodER = None
+        self.YER = None
+        
 
     
-    def _2x(self):
-        """
-        make labels for double region system
-        """      
-        ind_ = self.ind
-        prod_= self.prod
-        Y_= self.Y
-    
-        # EU
-        ind_["Region"] = pd.Series("EU" ,index = ind_.index)
-        EUind = ind_[['Synonym','Region', 'Code', 'Name']]
+    @property
+    def regions(self):
+        if self._regions is None:
+            self._regions = sut_store.regions(SUT)
         
-        prod_["Region"] = pd.Series("EU" ,index = prod_.index)
-        EUprod = prod_[['Synonym','Region', 'Code', 'Name']]
+        return(self._regions)
     
-        Y_["Region"] = pd.Series("EU" ,index = Y_.index)
-        EU_Y = Y_[['Synonym','Region', 'Code', 'Name']]
-        
-        # ROW
-        
-        ind_["Region"] = pd.Series("ROW" ,index = ind_.index) 
-        ROWind = ind_[['Synonym','Region', 'Code', 'Name']]
-        
-        prod_["Region"] = pd.Series("ROW" ,index = prod_.index)
-        ROWprod = prod_[['Synonym','Region', 'Code', 'Name']]
+    def value_added(self):
+        """
+        Number of value added rows at the top of E (codes w..), 
+        those balancing the industry output with the intermediates
+        """
+        return(int(self.E["Code"].astype(str).str.startswith("w").sum()))
+    
+    def _nx(self):
+        """
+        make labels for a multi-regional system, one block of labels
+        per region (built once)
+        """      
+        if self.prodER is not None:
+            return(self)
         
-        Y_["Region"] = pd.Series("ROW" ,index = Y_.index)
-        ROW_Y = Y_[['Synonym','Region', 'Code', 'Name']]
+        regions = []
+        for r in self.regions:
+            reg = {}
+            for l, labels in [["ind", self.ind], ["prod", self.prod], ["Y", self.Y]]:
+                labels = labels.copy()
+                labels["Region"] = pd.Series(r ,index = labels.index)
+                reg[l] = labels[['Synonym','Region', 'Code', 'Name']]
+            regions.append(reg)
           
-        # EU + ROW
-        self.indER =  pd.concat([EUind, ROWind], axis = 0, ignore_index = True, copy=False)
-        self.prodER =  pd.concat([EUprod, ROWprod], axis = 0, ignore_index = True, copy=False)
-        self.YER =  pd.concat([EU_Y, ROW_Y], axis = 0, ignore_index = True, copy=False)
+        # region blocks
+        self.indER =  pd.concat([r["ind"] for r in regions], axis = 0, ignore_index = True)
+        self.prodER =  pd.concat([r["prod"] for r in regions], axis = 0, ignore_index = True)
+        self.YER =  pd.concat([r["Y"] for r in regions], axis = 0, ignore_index = True)
         
         
         return(self)
     
+    _2x = _nx # two regions (EU, ROW) is the case of the EXIOBASE SUT
+    
+    def mi_(self, key):
+        """
+        MultiIndex of a label set (see names), built once and shared 
+        by all the tables labelled with it
+        """
+        k = (tuple(self.regions), key)
+        if k not in _mis:
+            attr, names = self.names[key]
+            labels = getattr(self._nx(), attr)
+            _mis[k] = mi.from_arrays(labels.values.T, names = names)
+        
+        return(_mis[k])
+    
     
     # all the needed types of labelling automatation
     
     def _326x400(self, matrix):   
         matrix = df(matrix) 
-        ind = self._2x().indER
-        prod = self._2x().prodER
         
         try:
-            matrix.columns = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
+            matrix.columns = self.mi_("prod")
         except ValueError:    
-            matrix.columns = mi.from_arrays(ind.values.T, names = ["abb","reg","code","name"])
-            matrix.index = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
+            matrix.columns = self.mi_("ind")
+            matrix.index = self.mi_("prod")
         else:
-            matrix.index = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
+            matrix.index = self.mi_("prod")
             
         return (matrix)    
     
     def _400x400(self, matrix):   
         matrix = df(matrix)
-        prod = self._2x().prodER
-        matrix.columns = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
-        matrix.index = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
+        matrix.columns = self.mi_("prod")
+        matrix.index = self.mi_("prod")
         return(matrix)
     
     def _E(self, matrix): # primary input
         matrix = df(matrix)
-        ind = self._2x().indER
-        prod = self._2x().prodER
-        E_ = self.E
         
         try:
-            matrix.index = mi.from_arrays(ind.values.T, names = ["abb","reg","code","name"])
+            matrix.index = self.mi_("ind")
         except ValueError:
             try:
-                matrix.index = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
+                matrix.index = self.mi_("prod")
             except ValueError:       
-                matrix.index = mi.from_arrays(E_.values.T, names = ["abb","reg","code","name"]) 
+                matrix.index = self.mi_("E")
         finally:
             try:
-                matrix.columns = mi.from_arrays(ind.values.T, names = ["abb","reg","code","name"])
+                matrix.columns = self.mi_("ind")
             except ValueError:
                 try:
-                    matrix.columns = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
+                    matrix.columns = self.mi_("prod")
                 except ValueError:        
-                    matrix.columns = mi.from_arrays(E_.values.T, names = ["abb","reg","code","name"]) 
+                    matrix.columns = self.mi_("E")
         
         return(matrix)
         
     def _Y(self, matrix):
         matrix = df(matrix)
-        YER = self._2x().YER
-        prod = self._2x().prodER
         
         try:
-            matrix.index = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
+            matrix.index = self.mi_("prod")
         except ValueError:
-            matrix.index = mi.from_arrays(YER.values.T, names = ["abb","reg","code","name"]) 
-            matrix.columns = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"]) 
+            matrix.index = self.mi_("Y")
+            matrix.columns = self.mi_("prod")
         else:
-            matrix.columns = mi.from_arrays(YER.values.T, names = ["abb","reg","code","name"]) 
+            matrix.columns = self.mi_("Y")
         return(matrix)
     
     def _Pr(self, matrix):
         matrix = df(matrix)
-        prod = self._2x().prodER
         
         try:
-            matrix.index = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
+            matrix.index = self.mi_("prod")
         except ValueError:
-            matrix.columns = mi.from_arrays(prod.values.T, names = ["abb","reg","code","name"])
+            matrix.columns = self.mi_("prod")
         return(matrix)
     
     def _Pr_short(self, matrix):
         matrix = df(matrix)
-        prod_ = self.prod
         
         try:
-            matrix.index = mi.from_arrays(prod_.values.T, names = ["abb","code","name"])
+            matrix.index = self.mi_("prod_short")
         except ValueError:
-            matrix.columns = mi.from_arrays(prod_.values.T, names = ["abb","code","name","reg"])
+            matrix.columns = self.mi_("prod_short")
         return(matrix)
     
     def _Ind(self, matrix):
         matrix = df(matrix)
-        ind = self._2x().indER
         
         try:
-            matrix.index = mi.from_arrays(ind.values.T, names = ["abb","reg","code","name"])
+            matrix.index = self.mi_("ind")
         except ValueError:
-            matrix.columns = mi.from_arrays(ind.values.T, names = ["abb","reg","code","name"]) 
+            matrix.columns = self.mi_("ind")
         return(matrix)
     
     def _FD(self, matrix):
         matrix = df(matrix)
-        Y = self._2x().YER
         
         try:
-            matrix.index = mi.from_arrays(Y.values.T, names = ["abb","reg","code","name"])
+            matrix.index = self.mi_("Y")
         except ValueError:
-            matrix.columns = mi.from_arrays(Y.values.T, names = ["abb","reg","code","name"]) 
+            matrix.columns = self.mi_("Y")
         return(matrix)
         
     def _Rcol(self, matrix):
         matrix = df(matrix)
-        prod_ = self._2x().prodER
-        ind_ = self._2x().indER
         
         try:
-            matrix.index = mi.from_arrays(prod_.values.T, names = ["abb","code","name", "reg"])
-        except ValueError:
-            matrix.columns = mi.from_arrays(prod_.values.T, names = ["abb","code","name", "reg"])
+            matrix.index = self.mi_("prod_Rcol")
         except ValueError:
             try:
-                matrix.index = mi.from_arrays(ind_.values.T, names = ["abb","code","name", "reg"])
+                matrix.columns = self.mi_("prod_Rcol")
             except ValueError:
-                matrix.columns = mi.from_arrays(ind_.values.T, names = ["abb","code","name", "reg"])
+                try:
+                    matrix.index = self.mi_("ind_Rcol")
+                except ValueError:
+                    matrix.columns = self.mi_("ind_Rcol")
         return(matrix)
     
     def _Bm(self, matrix):
         matrix = df(matrix)
-        Bm = self.Bm
+        
         try:
-            matrix.index = mi.from_arrays(Bm.values.T, names = ["abb", "name", "unit"])
+            matrix.index = self.mi_("Bm")
         except ValueError:
-            matrix.columns = mi.from_arrays(Bm.values.T, names = ["abb", "name", "unit"]) 
+            matrix.columns = self.mi_("Bm")
         return(matrix)
     
     def _Be(self, matrix):
         matrix = df(matrix)
         
-        Be = self.Be
         try:
-            matrix.index = mi.from_arrays(Be.values.T, names = ["abb","code","name","unit"])
+            matrix.index = self.mi_("Be")
         except ValueError:
-            matrix.columns = mi.from_arrays(Be.values.T, names = ["abb","code","name", "unit"]) 
+            matrix.columns = self.mi_("Be")
         return(matrix)
         
     def _Br(self, matrix):
         matrix = df(matrix)
-        Br = self.Br
+        
         try:
-            matrix.index = mi.from_arrays(Br.values.T, names = ["abb","name"])
+            matrix.index = self.mi_("Br")
         except ValueError:
-            matrix.columns = mi.from_arrays(Br.values.T, names = ["abb","name"])
+            matrix.columns = self.mi_("Br")
             
         return(matrix)
 
 
+class Resolver:
+    """
+    Integer positions of (category, region) selectors on table labels
+    
+    The category is the first level of the labels and the region the level
+    (first or second) holding region labels. Lookups from categories, 
+    regions and (category, region) to positions are built once per index 
+    and reused, so selections never swap index levels or search labels
+    
+    Tables in the region-blocked layout (one block of the same categories
+    per region, see Labels._nx) are resolved to block slices: a region is
+    a slice, a (category, region) an offset in its block
+    """
+    
+    def __init__(self, regions, size = 64):
+        self.regions = list(regions)
+        self.size = size # indices kept in the lookup cache
+        self.lookups = {}
+    
+    def levels(self, index):
+        """
+        Level numbers of the category and of the region (None if absent)
+        """
+        return(self.lookup(index)["levels"])
+    
+    @staticmethod
+    def blocks_(cats, regs):
+        """
+        Region blocks of an index: {region: slice} and the block size 
+        if every region is one contiguous block of the same categories
+        """
+        regions = pd.unique(regs)
+        n = len(regs)
+        if n == 0 or n % len(regions) != 0:
+            return(None, None)
+        
+        size = n // len(regions)
+        regs_ = regs.reshape(len(regions), size)
+        cats_ = cats.reshape(len(regions), size)
+        if not ((regs_ == regs_[:, :1]).all() and (cats_ == cats_[:1]).all()):
+            return(None, None)
+        
+        blocks = {r: slice(b * size, (b + 1) * size) for b, r in enumerate(regs_[:, 0])}
+        
+        return(blocks, size)
+    
+    def lookup(self, index):
+        hit = self.lookups.get(id(index))
+        if hit is not None and hit["index"] is index:
+            return(hit)
+        
+        cat_lv, reg_lv = 0, None
+        if isinstance(index, mi):
+            for l in range(min(2, index.nlevels)):
+                if index.get_level_values(l).isin(self.regions).all():
+                    reg_lv = l
+                    if l == 0:
+                        cat_lv = 1
+                    break
+        
+        cats = np.asarray(index.get_level_values(cat_lv), dtype = object)
+        blocks, size = None, None
+        if reg_lv is not None:
+            regs = np.asarray(index.get_level_values(reg_lv), dtype = object)
+            blocks, size = self.blocks_(cats, regs)
+        
+        if blocks is not None:
+            # categories as offsets in the first block
+            first = cats[:size]
+            by_cat = pd.Series(range(size)).groupby(first, sort = False).indices
+            by_reg, by_catreg = blocks, {}
+        else:
+            by_cat = pd.Series(range(len(index))).groupby(cats, sort = False).indices
+            by_reg, by_catreg = {}, {}
+            if reg_lv is not None:
+                by_reg = pd.Series(range(len(index))).groupby(regs, sort = False).indices
+                by_catreg = pd.Series(range(len(index))).groupby([cats, regs], sort = False).indices
+        
+        if len(self.lookups) >= self.size:
+            del self.lookups[next(iter(self.lookups))]
+        
+        hit = {"index":index,
+               "levels":(cat_lv, reg_lv),
+               "blocks":blocks,
+               "size":size,
+               "cat":by_cat,
+               "reg":by_reg,
+               "catreg":by_catreg
+               }
+        self.lookups[id(index)] = hit
+        
+        return(hit)
+    
+    @staticmethod
+    def slice_(pos):
+        """
+        Contiguous positions as a slice (basic indexing, no copies)
+        """
+        if len(pos) > 0 and pos[-1] - pos[0] == len(pos) - 1:
+            return(slice(int(pos[0]), int(pos[-1]) + 1))
+        
+        return(pos)
+    
+    def positions(self, index, key):
+        """
+        key = slice(None), category, region or (category, region)
+        returns a slice or an array of positions
+        """
+        if isinstance(key, slice):
+            return(key)
+        
+        lk = self.lookup(index)
+        blocks = lk["blocks"]
+        
+        if type(key) == tuple:
+            if lk["levels"][1] is None:
+                raise KeyError(str(key) + " needs a region level in " + str(index.names))
+            if blocks is not None:
+                cat, reg = key
+                pos = lk["cat"].get(cat)
+                if pos is not None and reg in blocks:
+                    pos = self.slice_(pos + blocks[reg].start)
+                else:
+                    pos = None
+            else:
+                pos = lk["catreg"].get(key)
+        elif key in self.regions and lk["levels"][1] is not None:
+            pos = lk["reg"].get(key)
+        else:
+            pos = lk["cat"].get(key)
+            if pos is not None and blocks is not None:
+                starts = np.array([b.start for b in blocks.values()])
+                pos = self.slice_((starts[:, None] + pos[None, :]).ravel())
+        
+        if pos is None:
+            raise KeyError(str(key) + " not found in index " + str(index.names))
+        
+        return(pos)
+    
+    @staticmethod
+    def ix_(rows, cols):
+        """
+        Indexer of the block rows x cols for numpy arrays, slices stay 
+        basic indexing (views) and only two arrays need np.ix_
+        """
+        if isinstance(rows, slice) or isinstance(cols, slice):
+            return(rows, cols)
+        
+        return(np.ix_(rows, cols))
+    
+    def matched(self, index, key):
+        """
+        Levels fixed by key, those pandas drops in index.loc[key]
+        """
+        cat_lv, reg_lv = self.levels(index)
+        
+        if isinstance(key, slice):
+            return([])
+        elif type(key) == tuple:
+            return([cat_lv, reg_lv])
+        elif key in self.regions and reg_lv is not None:
+            return([reg_lv])
+        else:
+            return([cat_lv])
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Description: Lazy IOT container, each component (or group of components
+             computed together) is computed on first access, extension
+             blocks can also give only some of their rows
+"""
+from collections.abc import MutableMapping
+import profiler
+
+
+class _Pending:
+    """
+    Components not computed yet
+
+    fn() = value of the component, or a tuple for a group of keys
+    rows(x) = rows of the component matching the selector x
+    after = functions applied to a value once computed (see then)
+    """
+    def __init__(self, keys, fn, rows = None):
+        self.keys = keys
+        self.fn = fn
+        self.rows = rows
+        self.after = {}
+
+
+class LazyIOT(MutableMapping):
+    """
+    Dictionary of IOT components computed on first access
+
+    IOT.define("Be", lambda: ..., rows = lambda x: ...)
+    IOT.define(["RBe", "Be"], lambda: (RBe, Be)), computed together
+
+    iterating or pickling computes all components, a pickled LazyIOT
+    is read back as a dict
+    """
+    def __init__(self, data = None, stage = "compute"):
+        self.data = {}
+        self.stage = stage
+        if data is not None:
+            self.update(data)
+
+    def define(self, keys, fn, rows = None):
+        """
+        keys = component or list of components returned together by fn
+        rows = rows(x) computes only the rows matching x (see select)
+        """
+        if type(keys) == str:
+            p = _Pending([keys], lambda: (fn(),), rows)
+        else:
+            p = _Pending(list(keys), fn, rows)
+
+        for k in p.keys:
+            self.data[k] = p
+
+    def computed(self, key):
+        return(not isinstance(self.data[key], _Pending))
+
+    def then(self, key, f):
+        """
+        Applies f to the component, now or once it is computed
+        """
+        p = self.data[key]
+        if not isinstance(p, _Pending):
+            self.data[key] = f(p)
+        elif key in p.after:
+            g = p.after[key]
+            p.after[key] = lambda v: f(g(v))
+        else:
+            p.after[key] = f
+
+    def select(self, key, x):
+        """
+        Rows of a component matching x (e.g. an extension code), only
+        those rows are computed if the component is still pending and
+        can give them, the whole component otherwise
+        """
+        p = self.data[key]
+        if isinstance(p, _Pending) and p.rows is not None:
+            with profiler.stage(self.stage, matrix = key, rows = x):
+                M = p.rows(x)
+                if key in p.after:
+                    M = p.after[key](M)
+            return(M)
+
+        return(self[key])
+
+    def __getitem__(self, key):
+        p = self.data[key]
+        if isinstance(p, _Pending):
+            with profiler.stage(self.stage, matrix = key):
+                values = p.fn()
+
+            for k, v in zip(p.keys, values):
+                if self.data.get(k) is p:
+                    self.data[k] = p.after[k](v) if k in p.after else v
+
+        return(self.data[key])
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __iter__(self):
+        return(iter(self.data))
+
+    def __len__(self):
+        return(len(self.data))
+
+    def __reduce__(self):
+        return(dict, (dict(self.items()),))
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Description: Opt-in instrumentation of the stages of a run, wall time, CPU time
+             and peak allocated memory (tracemalloc) per stage, written as a
+             JSON report at the end of the run
+
+             enable("report.json") or set EEIOA_PROFILE=report.json before
+             starting python, when disabled stages cost one check
+"""
+import os
+import json
+import time
+import atexit
+import inspect
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+_run = None # active run, None when disabled
+
+
+class Run:
+    """
+    Records of the stages of one run
+
+    path = JSON report written by dump (and at exit)
+    memory = True, trace peak allocated memory (slower)
+    """
+    def __init__(self, path = None, memory = True):
+        self.path = path
+        self.memory = memory
+        self.started = time.time()
+        self.records = []
+        self.stack = [] # open stages: name, tags, child peak
+        self.tracing = memory and not tracemalloc.is_tracing()
+
+        if self.tracing:
+            tracemalloc.start()
+
+
+def enable(path = None, memory = True):
+    """
+    Starts recording stages, the report is written to path at exit
+    """
+    global _run
+    disable()
+    _run = Run(path, memory)
+
+    if path is not None:
+        atexit.unregister(dump)
+        atexit.register(dump)
+
+    return(_run)
+
+
+def disable():
+    global _run
+    if _run is not None and _run.tracing:
+        tracemalloc.stop()
+    _run = None
+
+
+def enabled():
+    return(_run is not None)
+
+
+@contextmanager
+def stage(name, **tags):
+    """
+    Records a stage, nested stages inherit the tags of the enclosing ones
+    """
+    if _run is None:
+        yield
+        return
+
+    run = _run
+    if run.stack:
+        tags = dict(run.stack[-1]["tags"], **tags)
+    path = "/".join([s["name"] for s in run.stack] + [name])
+
+    frame = {"name": name, "tags": tags, "peak": 0}
+    if run.memory:
+        frame["start"], frame["parent_peak"] = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+    run.stack.append(frame)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        run.stack.pop()
+
+        record = {"stage": name, "path": path, "wall": wall, "cpu": cpu}
+        if run.memory:
+            peak = max(tracemalloc.get_traced_memory()[1], frame["peak"])
+            record["peak_bytes"] = peak - frame["start"]
+            # the peak of the enclosing stage includes this one
+            if run.stack:
+                run.stack[-1]["peak"] = max(run.stack[-1]["peak"], peak, frame["parent_peak"])
+        record.update({l: str(v) for l, v in tags.items()})
+        record["pid"] = os.getpid()
+
+        run.records.append(record)
+
+
+def timed(name, *arg_tags):
+    """
+    Decorator recording each call as a stage, arg_tags are the names of
+    the arguments added to the record (e.g. the scenario number)
+    """
+    def decorator(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _run is None:
+                return(fn(*args, **kwargs))
+
+            bound = sig.bind(*args, **kwargs).arguments
+            tags = {l: bound[l] for l in arg_tags if l in bound}
+            with stage(name, **tags):
+                return(fn(*args, **kwargs))
+
+        return(wrapper)
+
+    return(decorator)
+
+
+def take():
+    """
+    Returns and clears the records, used to send them back from workers
+    """
+    if _run is None:
+        return([])
+
+    records, _run.records = _run.records, []
+    return(records)
+
+
+def extend(records):
+    if _run is not None:
+        _run.records.extend(records)
+
+
+def report():
+    """
+    All records plus totals by stage
+    """
+    totals = {}
+    for r in _run.records:
+        t = totals.setdefault(r["path"], {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_bytes": 0})
+        t["calls"] += 1
+        t["wall"] += r["wall"]
+        t["cpu"] += r["cpu"]
+        t["peak_bytes"] = max(t["peak_bytes"], r.get("peak_bytes", 0))
+
+    return({"started": _run.started, "pid": os.getpid(), "memory": _run.memory,
+            "stages": _run.records, "totals": totals})
+
+
+def dump(path = None):
+    """
+    Writes the JSON report
+    """
+    if _run is None:
+        return
+
+    path = path or _run.path
+    if path is None:
+        return
+
+    with open(path, "w") as f:
+        json.dump(report(), f, indent = 1)
+
+
+if os.environ.get("EEIOA_PROFILE"):
+    enable(os.environ["EEIOA_PROFILE"])
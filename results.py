@@ -12,6 +12,8 @@ Scope: MSc research Modelling circular economy policies in EEIOA
 """
 import pandas as pd
 import numpy as np
+import multiprocessing as mp
+import os
 from labels import Labels as lb
 from pandas import DataFrame as df
 from dirs import scen_file
@@ -20,70 +22,104 @@ from dirs import SUT
 from dirs import where_r_results as wrr
 from SUTops import SUTops as sops
 from base_n_scen import Base_n_scen as bns
+import scen_plan
+from sweep import Sweep
+import spa
+from lazy import LazyIOT
+import profiler
 import warnings as warn 
 lb = lb()
 
+_shared = {} # state inherited by forked workers, never pickled
+
+
+def _init_worker(blas_threads):
+    """
+    Limit BLAS threads in a worker so that workers * blas_threads
+    does not oversubscribe the cores, the BLAS of a forked worker is
+    already loaded so its threads are limited with threadpoolctl
+    """
+    from threadpoolctl import threadpool_limits
+    _shared["limits"] = threadpool_limits(blas_threads)
+
+
+def _one_scen(scen_no, results_only):
+    """
+    One scenario in a worker, its stage records are sent back with it
+    """
+    profiler.take()
+    sc = _shared["results"].one_scen(scen_no, results_only)
+    return(sc, profiler.take())
+
+
 class GatherResults:
     """ 
     Group results for a specific scenario or all scenarios + baseline
     """       
     
-    def __init__(self, method):
+    def __init__(self, method, sparse = False, incremental = False, precision = "float64",
+                 solver = None, tol = 1e-10, precondition = True, balance = False):
         
-        scenarios = pd.ExcelFile(scen_file)
         self.method = method
-        sheet_names = scenarios.sheet_names    
-        self.sheets = [f for f in sheet_names if f.startswith("scenario_")]
-        self.bns = bns(method)
+        self.bns = bns(method, sparse, incremental, precision, solver, tol, precondition, balance)
         self.base = self.bns.baseIOT()
-        self.analyse = pd.read_excel(scen_file, "analyse", header = 0, index = None)
+        
+    @property
+    def plan(self):
+        """
+        Scenario file read once, shared with Apply_policy
+        """
+        return(scen_plan.load(scen_file, self.bns.ap.regions))
+    
+    @property
+    def sheets(self):
+        return(self.plan.sheets)
+    
+    @property
+    def analyse(self):
+        return(self.plan.analyse)
 
 
     def select_(self, ext, reg, prod, M):
         """
         Select extension by region and prod according to specifications
+        
+        rows and columns are taken by position (see labels.Resolver),
+        the levels fixed by the selection are dropped as in M.loc[x, y]
+        and a region without product is summed over its columns
         """
-        if pd.isnull(ext) is False:
-            x = (ext)
-            if pd.isnull(prod) is True:
-                if pd.isnull(reg) is True:
-                    y = slice(None)
-                elif pd.isnull(reg) is False:
-                    M.columns = M.columns.swaplevel(0, 1)
-                    y = reg
-            
-            elif pd.isnull(prod) is False:
-                if pd.isnull(reg) is False:
-                    y = (prod, reg)
-                elif pd.isnull(reg) is True:
-                    y = (prod)
-        
-        elif pd.isnull(ext) is True:
-            x = slice(None)
-            if pd.isnull(prod) is False:
-                
-                if pd.isnull(reg) is False:
-                    y = (prod, reg)
-                if pd.isnull(reg) is True:
-                    y = prod
-            elif pd.isnull(prod) is True:
-                if pd.isnull(reg) is False:
-                    M.columns = M.columns.swaplevel(0, 1)
-                    y = reg
+        res = self.bns.ap.res
+        
+        x = ext if pd.isnull(ext) is False else slice(None)
+        
+        if pd.isnull(prod) is False:
+            y = (prod, reg) if pd.isnull(reg) is False else prod
+        else:
+            y = reg if pd.isnull(reg) is False else slice(None)
+        
+        ix = res.positions(M.index, x)
+        iy = res.positions(M.columns, y)
+        a = np.array(M.values[res.ix_(ix, iy)], dtype = float)
+        
+        index = self.drop_(M.index[ix], res.matched(M.index, x))
+        columns = self.drop_(M.columns[iy], res.matched(M.columns, y))
         
-        try:
-            a = M.loc[x, y]
-        except KeyError:
-            a = M.loc[x, [y]]
-
         if y == reg:
-             M.columns = M.columns.swaplevel(0, 1)
-             a = df(a.sum(axis = 1))
+            a = df(a.sum(axis = 1), index = index)
+        else:
+            a = df(a, index = index, columns = columns)
         
-        if x == reg:
-             M.index = M.index.swaplevel(0, 1)
-             a = df(a.sum(axis = 0))
         return(a)
+    
+    @staticmethod
+    def drop_(index, levels):
+        """
+        Drops the levels fixed by a selection if others are left
+        """
+        if len(levels) > 0 and index.nlevels > len(levels):
+            index = index.droplevel(levels)
+        
+        return(index)
         
     def sep_bas_scen(self, data, fltrd_anls, scen_no):
         """
@@ -112,7 +148,11 @@ class GatherResults:
                         warn.warn("regB assummed as regA - Can't compare a reg against the whole world - ref: "+ scen_no + ", " + M_name + ", " + ext)
                         regB = regA
 
-                M = data[M_name]
+                # only the rows of ext are computed if M is still pending
+                if isinstance(data, LazyIOT):
+                    M = data.select(M_name, ext if pd.isnull(ext) is False else slice(None))
+                else:
+                    M = data[M_name]
                 
                 if scen_no == "baseline":
                     select = self.select_(ext, regA, stageA, M)
@@ -129,6 +169,7 @@ class GatherResults:
         return(D)
         
         
+    @profiler.timed("results", "scen_no")
     def iter_thru_for_results(self, data, scen_no):
         """
         filter policy interventions from scenario file according to specified 
@@ -162,9 +203,14 @@ class GatherResults:
         
 class Results:
     
-    def __init__(self, method = 0):
+    def __init__(self, method = 0, sparse = False, incremental = False, precision = "float64",
+                 solver = None, tol = 1e-10, precondition = True, balance = False):
+        """
+        solver, tol, precondition = iterative scenario solver (see Base_n_scen)
+        balance = GRAS balancing of the scenario tables (see Base_n_scen)
+        """
         self.method = method
-        self.gr = GatherResults(self.method)
+        self.gr = GatherResults(self.method, sparse, incremental, precision, solver, tol, precondition, balance)
 
     def one_scen(self, scen_no = None, results_only = True):
         """
@@ -173,8 +219,14 @@ class Results:
         if scen_no in [0,"baseline", "base", None]:
             sc = self.gr.base
         else:
-            sc = self.gr.bns.sceneIOT(scen_no)
+            sc = self.gr.bns.sceneIOT(scen_no, self.gr.base)
         
+        return(self.results_(sc, scen_no, results_only))
+    
+    def results_(self, sc, scen_no, results_only = True):
+        """
+        Results of a scenario IOT (see one_scen)
+        """
         results = self.gr.iter_thru_for_results(sc, scen_no)
         
         if results_only == True:
@@ -190,43 +242,130 @@ class Results:
         return(sc)
         
     
-    def table_res(self, results_only = True):
+    def sweep(self, scen_no, params, batch = 64):
+        """
+        Results of every combination of parameter values of a scenario
+        e.g. sweep(1, {"l_kp": range(0, 101, 10), (2, "fx_kp"): [40, 80]})
+        (see sweep.Sweep)
+        """
+        return(Sweep(self.gr, scen_no).run(params, batch))
+    
+    def footprints(self, scen_no = None, ext = "Be", codes = None, level = None):
+        """
+        Consumption-based footprints of the baseline or of a scenario
+        e.g. footprints(1, "Be", ["E_CO2_c to air"], level = "reg")
+        (see Base_n_scen.footprints)
+        """
+        return(self.gr.bns.footprints(scen_no, ext, codes, level, self.gr.base))
+    
+    def content(self, inputs, demand = False):
+        """
+        Product content of the input products in every product for the
+        baseline and every scenario (see Base_n_scen.content)
+        e.g. content(["C_STEL", ("C_ALUM", "EU")])
+        """
+        bns, base = self.gr.bns, self.gr.base
+        
+        tables = {"baseline": bns.content(inputs, None, demand, base)}
+        for n in range(1, len(self.gr.sheets) + 1):
+            tables["sc_" + str(n)] = bns.content(inputs, n, demand, base)
+        
+        return(pd.concat(tables))
+    
+    def paths(self, scen_no, ext, code, target = slice(None), threshold = 0.001, depth = 8, max_paths = 1000):
+        """
+        Structural paths of a stressor in the baseline and in a scenario
+        e.g. paths(1, "Be", "E_CO2_c to air", ("C_MOTO", "EU"))
+        (see spa.SPA and spa.compare)
+        """
+        bns, base = self.gr.bns, self.gr.base
+        
+        scen = bns.sceneIOT(scen_no, base)
+        L_ = bns.system_(bns.scen_(scen_no), base)[1]
+        
+        a = spa.SPA(base, ext, code, bns.base_leontief(base), bns.regions)
+        b = spa.SPA(scen, ext, code, L_, bns.regions)
+        
+        return(spa.compare(a, b, target, threshold, depth, max_paths))
+    
+    @profiler.timed("table_res")
+    def table_res(self, results_only = True, workers = 1, blas_threads = None):
         """
         Take a dictionary of all scenarios' results
         and organise them in table
-        """        
-
         
-        if results_only == False:
-            C = {}
+        workers = number of processes calculating scenarios in parallel
+        blas_threads = BLAS threads per worker (default cores/workers),
+                       limited with threadpoolctl
+        """
+        scens = list(range(1, len(self.gr.sheets) + 1))
         
-        n = 1   
-        while n <= len(self.gr.sheets):
-            print(n)
-            if n == 1:
-                t = self.one_scen(n, results_only)
-                if results_only == False:
-                    name = "sc_" + str(n)
-                    C[name] = t
- 
-            elif n > 1:
-                t2 = self.one_scen(n, results_only)
-                
-                if results_only == True:
-                    t = pd.concat([t,t2], axis = 1 )
-
-                elif results_only == False:
-                    name = "sc_" + str(n)
-                    C[name] = t2
-            n +=1
+        # final demand only scenarios are solved together on the baseline
+        y_only = [n for n in scens if self.gr.bns.y_only(n)]
+        rest = [n for n in scens if n not in y_only]
+        
+        res = {}
+        if len(y_only) > 0:
+            IOTs = self.gr.bns.y_onlyIOT(y_only, self.gr.base)
+            for n, sc in zip(y_only, IOTs):
+                print(n)
+                res[n] = self.results_(sc, n, results_only)
+        
+        if workers > 1 and len(rest) > 1:
+            res.update(zip(rest, self.par_scen(rest, results_only, workers, blas_threads)))
+        else:
+            for n in rest:
+                print(n)
+                res[n] = self.one_scen(n, results_only)
+        
+        res = [res[n] for n in scens]
             
         baseline =  self.one_scen("baseline", results_only)
         if results_only == False:
+            C = {}
+            for n, t in zip(scens, res):
+                C["sc_" + str(n)] = t
             C["baseline"] = baseline
         else:
-            C = pd.concat([baseline,t], axis = 1).transpose()
+            C = pd.concat([baseline] + res, axis = 1).transpose()
                     
         return(C)     
+    
+    def par_scen(self, scens, results_only, workers, blas_threads = None):
+        """
+        Calculate scenarios in forked worker processes
+        
+        workers inherit this object and the baseline IOT from the parent
+        (copy-on-write memory), only scenario numbers and results are
+        sent between processes. Results are returned in the order of scens
+        """
+        if "fork" not in mp.get_all_start_methods():
+            warn.warn("Parallel scenarios need the fork start method, running them sequentially")
+            return([self.one_scen(n, results_only) for n in scens])
+        
+        try:
+            import threadpoolctl
+        except ImportError:
+            raise ImportError("Parallel scenarios need threadpoolctl to limit the BLAS threads of each worker (pip install threadpoolctl), or run them with workers = 1")
+        
+        workers = min(workers, len(scens))
+        
+        if blas_threads is None:
+            blas_threads = max(1, (os.cpu_count() or 1) // workers)
+        
+        _shared["results"] = self
+        ctx = mp.get_context("fork")
+        try:
+            with ctx.Pool(workers, _init_worker, (blas_threads,)) as pool:
+                res = pool.starmap(_one_scen, [(n, results_only) for n in scens])
+        finally:
+            del _shared["results"]
+        
+        for sc, records in res:
+            profiler.extend(records)
+        res = [sc for sc, records in res]
+        
+        return(res)
 
 
         
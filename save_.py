@@ -2,7 +2,7 @@
 """
 Created on Sat Mar  4 11:02:52 2017
 
-Description: Save data to xls
+Description: Save data to xls or to npz arrays with label metadata
 
 Scope: MSc research Modelling circular economy policies in EEIOA
 
@@ -11,15 +11,75 @@ Scope: MSc research Modelling circular economy policies in EEIOA
 @institution: Leiden University CML, TU Delft TPM
 """
 import pandas as pd
+import numpy as np
+import json
 from dirs import specs
 from pandas import DataFrame as df
 import datetime
 now = datetime.datetime.now()
 import os
+import profiler
+
+labels_key = "__labels__"
+
+
+def labels_(idx):
+    """
+    Index or MultiIndex as JSON-ready metadata
+    """
+    values = [list(v) if isinstance(v, tuple) else v for v in idx.tolist()]
+    return({"values": values, "names": list(idx.names)})
+
+
+def index_(meta):
+    """
+    Index or MultiIndex from its metadata
+    """
+    values = meta["values"]
+    if len(meta["names"]) > 1:
+        return(pd.MultiIndex.from_tuples([tuple(v) for v in values], names = meta["names"]))
+    
+    return(pd.Index(values, name = meta["names"][0]))
+
+
+def scalar_(x):
+    # numpy scalars in labels
+    if hasattr(x, "item"):
+        return(x.item())
+    raise TypeError(str(type(x)) + " is not JSON serializable")
+
+
+def load_(file):
+    """
+    Reads back all the tables saved in a npz file as DataFrames
+    """
+    with np.load(file, allow_pickle = False) as data:
+        meta = json.loads(str(data[labels_key]))
+        tables = {}
+        for l, m in meta["tables"].items():
+            tables[l] = df(data[l], index = index_(m["index"]), columns = index_(m["columns"]))
+    
+    tables["general_specs"] = df(meta["general_specs"], index = ["General_info"]).T
+    
+    return(tables)
+
 
 class Save:
+    """
+    Save results and tables
     
-    def __init__(self, directory, method):
+    fmt = "xlsx", all tables in excel sheets
+    fmt = "npz", tables as arrays with their labels as JSON metadata 
+        (see load_), summary results are always saved to xlsx
+    """
+    formats = ["xlsx", "npz"]
+    
+    def __init__(self, directory, method, fmt = "xlsx"):
+        
+        if fmt not in self.formats:
+            raise KeyError("Only the following formats are allowed =>" + str(self.formats))
+        
+        self.fmt = fmt
         
         self.directory = directory + str(now.month) + "_" + str(now.day) + "_" +str(now.hour) + "_" + str(now.minute) + "/"
 
@@ -43,28 +103,54 @@ class Save:
         return(general)
     
     
+    @profiler.timed("save", "scen_no")
     def save_(self, data, scen_no):
         
+        fmt = self.fmt
+        
         if scen_no == "summary_results":
-            file = self.directory + scen_no + ".xlsx" 
+            file = self.directory + scen_no
+            fmt = "xlsx"
         
         elif scen_no in ["baseline", 0, "base"]:
-            file = self.directory + "baseline.xlsx"
+            file = self.directory + "baseline"
 
         elif scen_no not in ["baseline", 0, "base"]:
 
             scen_no = str(scen_no)
-            file = self.directory + "scenario_" + scen_no[-1] + ".xlsx"       
+            file = self.directory + "scenario_" + scen_no[-1]
 
-        writer = pd.ExcelWriter(file, engine="xlsxwriter")
+        if fmt == "npz":
+            return(self.save_npz(data, scen_no, file + ".npz"))
+        
+        file = file + ".xlsx"
+        
+        with pd.ExcelWriter(file, engine="xlsxwriter") as writer:
 
-        specs = self.gen_specs(scen_no)
-        specs.to_excel(writer, sheet_name = "general_specs")
+            specs = self.gen_specs(scen_no)
+            specs.to_excel(writer, sheet_name = "general_specs")
 
-        for l,value in data.items():
-            value.to_excel(writer, l)      
+            for l,value in data.items():
+                value.to_excel(writer, sheet_name = l)
+        
+    
+    def save_npz(self, data, scen_no, file):
+        """
+        Saves the values of each table as an array and their labels as
+        JSON metadata in one npz file
+        """
+        specs = self.gen_specs(scen_no)["General_info"]
+        meta = {"general_specs": {l: str(v) for l, v in specs.items()}, "tables": {}}
+        
+        arrays = {}
+        for l, value in data.items():
+            value = df(value)
+            arrays[l] = value.values.astype(np.float64)
+            meta["tables"][l] = {"index": labels_(value.index), "columns": labels_(value.columns)}
+        
+        arrays[labels_key] = np.array(json.dumps(meta, default = scalar_))
         
-        writer.save()
+        np.savez(file, **arrays)
         
         
   
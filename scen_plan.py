@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Description: Reading scenarios.xls once into a plan of policy interventions
+             grouped by scenario and matrix
+"""
+import os
+import hashlib
+import pandas as pd
+import profiler
+
+_plans = {} # one plan per scenario file and set of regions
+
+
+def load(scen_file, regions):
+    """
+    Returns the plan of scen_file, read again only if the file changed
+    """
+    key = (os.path.abspath(scen_file), tuple(regions))
+    plan = _plans.get(key)
+
+    if plan is None or plan.changed():
+        plan = Scen_plan(scen_file, regions)
+        _plans[key] = plan
+
+    return(plan)
+
+
+class Scen_plan:
+    """
+    All scenario sheets and the analyse sheet of the scenario file,
+    validated and grouped by scenario and by matrix
+
+    scen_file = path to scenarios.xls
+    regions = regions allowed in reg_A1, reg_A2, reg_B1, reg_B2
+    """
+
+    interventions = ["direct", "indirect", "expansion"]
+    reg_cols = ["reg_A1", "reg_A2", "reg_B1", "reg_B2"]
+    num_cols = ["expansion", "life", "share", "recycle", "l_kp", "s_kp", "r_kp", "fx_kp"]
+
+    @profiler.timed("read scenarios")
+    def __init__(self, scen_file, regions):
+        self.file = scen_file
+        self.regions = list(regions)
+        self.stamp = self.stamp_()
+        self.digest = self.digest_()
+
+        scenarios = pd.ExcelFile(scen_file)
+        self.sheets = [f for f in scenarios.sheet_names if f.startswith("scenario_")]
+        self.analyse = scenarios.parse("analyse", header = 0)
+
+        self.policies = {}
+        self.empty = {}
+        for sheet in self.sheets:
+            scenario = scenarios.parse(sheet, header = 1)
+            scenario = scenario.loc[scenario["matrix"].notnull()]
+            self.validate(sheet, scenario)
+
+            self.empty[sheet] = scenario.iloc[:0]
+            self.policies[sheet] = {}
+            for M_name, fltr_policies in scenario.groupby("matrix", sort = False):
+                self.policies[sheet][M_name] = fltr_policies
+
+    def stamp_(self):
+        st = os.stat(self.file)
+        return((st.st_mtime_ns, st.st_size))
+
+    def digest_(self):
+        with open(self.file, "rb") as f:
+            return(hashlib.sha1(f.read()).hexdigest())
+
+    def changed(self):
+        """
+        True if the content of the file changed since it was read
+        """
+        stamp = self.stamp_()
+        if stamp == self.stamp:
+            return(False)
+
+        self.stamp = stamp
+        return(self.digest_() != self.digest)
+
+    def validate(self, sheet, scenario):
+        """
+        Checks every intervention row before any of them is applied
+        """
+        for l, row in scenario.iterrows():
+            ref = " - ref: " + sheet + ", row " + str(l + 3) + ", matrix " + str(row["matrix"])
+
+            if row["intervention"] not in self.interventions:
+                raise KeyError("Only the following interventions are allowed =>" + str(self.interventions) + ref)
+
+            for r in self.reg_cols:
+                if pd.isnull(row[r]) == False and row[r] not in self.regions:
+                    raise KeyError("Only this regions are allowed =>" + str(self.regions) + ref)
+
+            if pd.isnull(row["reg_A1"]) and pd.isnull(row["reg_A2"]):
+                raise KeyError("It's not allowed to leave region unspecified, please add at least regA1 =>" + str(self.regions) + ref)
+
+            for c in self.num_cols:
+                if pd.isnull(row[c]) == False:
+                    try:
+                        float(row[c])
+                    except (TypeError, ValueError):
+                        raise ValueError(c + " must be a number, found " + str(row[c]) + ref)
+
+    def select_(self, sheet_name, M_name):
+        """
+        Policy interventions of a scenario on matrix M_name
+        """
+        if sheet_name not in self.policies:
+            raise KeyError(sheet_name + " is not in " + self.file + " - possible scenarios " + str(self.sheets))
+
+        fltr_policies = self.policies[sheet_name].get(M_name, self.empty[sheet_name])
+
+        return(fltr_policies)
+
+    def matrices(self, sheet_name):
+        """
+        Names of the matrices a scenario intervenes on
+        """
+        return(list(self.policies[sheet_name].keys()))
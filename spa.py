@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Description: Structural path analysis of the footprint of final demand,
+             supply chain paths are enumerated from the final products
+             upstream with branch-and-bound pruning, a path is followed
+             only while its whole upstream footprint exceeds a threshold
+"""
+import numpy as np
+import pandas as pd
+from SUTops import SUTops as sops
+from labels import Labels
+from labels import Resolver
+import profiler
+
+
+class SPA:
+    """
+    Structural paths of a stressor in a baseline or scenario IOT
+
+    IOT = IOT of baseIOT or sceneIOT (S, Y and the extension block)
+    ext = extension block, "E", "Be", "Br" or "Bm"
+    code = stressor, an extension code (rows matching it are summed)
+    L = Leontief system of the IOT A (solve_T), factorized if None
+
+    the value of a path j <- i1 <- ... <- in is
+    r[in] * A[in, ...] * ... * A[i1, j] * y[j]
+    """
+
+    def __init__(self, IOT, ext, code, L = None, regions = None):
+        self.res = Resolver(Labels().regions if regions is None else regions)
+
+        S = IOT["S"]
+        B = IOT[ext]
+        self.index = S.index
+
+        q = sops.IOT.q(S, IOT["Y"])
+        inv_diag_q = sops.inv(sops.diag(q))
+
+        A = sops.IOT.A(np.asarray(S.values, dtype = float), inv_diag_q)
+        self.A = sops.sparse(A).tocsc() # columns are the inputs of a product
+
+        rows = np.asarray(B.values, dtype = float)[self.res.positions(B.index, code)]
+        self.r = sops.IOT.R(np.atleast_2d(rows).sum(axis = 0), inv_diag_q)
+        self.y = np.asarray(np.sum(IOT["Y"], axis = 1), dtype = float)
+
+        if L is None:
+            L = sops.IOT.L(self.A)
+        self.m = L.solve_T(self.r) # multipliers, footprint upstream of each product
+
+    def label_(self, i):
+        return(", ".join([str(l) for l in self.index[i][:2]]))
+
+    @profiler.timed("spa")
+    def paths(self, target = slice(None), threshold = 0.001, depth = 8, max_paths = 1000):
+        """
+        Paths of the footprint of the final demand of target, largest first
+
+        target = product, region or (product, region) of the final demand
+        threshold = share of the footprint, paths whose upstream footprint
+                    is below it are not followed (with nonnegative A and r
+                    at most depth / threshold paths are visited)
+        depth = max number of upstream steps
+        max_paths = max number of paths returned
+
+        columns: depth, path (final product first), value, share,
+                 upstream (footprint of the path and all its extensions)
+        """
+        y = np.zeros(len(self.y))
+        pos = self.res.positions(self.index, target)
+        y[pos] = self.y[pos]
+
+        total = float(self.m @ y)
+        cut = threshold * abs(total)
+
+        roots = np.flatnonzero(np.abs(y * self.m) >= cut)
+        stack = [((j,), y[j]) for j in roots]
+        found = []
+
+        indptr, indices, data = self.A.indptr, self.A.indices, self.A.data
+        while stack:
+            path, w = stack.pop()
+            i = path[-1]
+
+            value = self.r[i] * w
+            if abs(value) >= cut:
+                found.append((len(path) - 1, path, value, w * self.m[i]))
+
+            if len(path) > depth:
+                continue
+
+            # inputs of i whose upstream footprint passes the threshold
+            k = indices[indptr[i]:indptr[i + 1]]
+            wk = data[indptr[i]:indptr[i + 1]] * w
+            keep = np.abs(wk * self.m[k]) >= cut
+            stack.extend([(path + (c,), v) for c, v in zip(k[keep], wk[keep])])
+
+        found.sort(key = lambda p: -abs(p[2]))
+        found = found[:max_paths]
+
+        table = pd.DataFrame({"depth": [p[0] for p in found],
+                              "path": [" <- ".join([self.label_(i) for i in p[1]]) for p in found],
+                              "value": [p[2] for p in found],
+                              "upstream": [p[3] for p in found]
+                              })
+        table["share"] = table["value"] / total if total != 0 else np.nan
+        table.attrs["total"] = total
+
+        return(table[["depth", "path", "value", "share", "upstream"]])
+
+
+def compare(base, scen, target = slice(None), threshold = 0.001, depth = 8, max_paths = 1000):
+    """
+    Paths of the baseline and of a scenario (SPA) side by side,
+    ordered by the largest absolute change
+    """
+    a = base.paths(target, threshold, depth, max_paths)
+    b = scen.paths(target, threshold, depth, max_paths)
+
+    table = pd.merge(a[["depth", "path", "value"]], b[["depth", "path", "value"]],
+                     on = ["depth", "path"], how = "outer", suffixes = ("_baseline", "_scenario"))
+    table = table.fillna({"value_baseline": 0.0, "value_scenario": 0.0})
+    table["difference"] = table["value_scenario"] - table["value_baseline"]
+
+    table = table.reindex(table["difference"].abs().sort_values(ascending = False).index)
+    table.attrs["total_baseline"] = a.attrs["total"]
+    table.attrs["total_scenario"] = b.attrs["total"]
+
+    return(table.reset_index(drop = True))
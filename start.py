@@ -12,6 +12,7 @@ Scope: MSc research Modelling circular economy policies in EEIOA
 """
 from save_ import Save
 from results import Results
+import profiler
 
     
 class Start:
@@ -23,7 +24,7 @@ class Start:
     
     Results will be saved in the output folder
     
-    The programme only considers two regions EU and Rest-Of-World (ROW)
+    Regions are those of the SUT in dirs.py, e.g. EU and Rest-Of-World (ROW)
     
     Permitted SUT transformation Methods are
     
@@ -37,11 +38,29 @@ class Start:
         "scenario_1" is also allowed for scenarios
         None, 0, base and baseline are also accepted for baseline 
     
+    workers = number of processes calculating all scenarios in parallel,
+              workers > 1 needs the optional threadpoolctl package
+              (pip install threadpoolctl), workers = 1 runs without it
+    blas_threads = BLAS threads per worker (default cores/workers),
+                   limited with threadpoolctl
+    
+    fmt = "xlsx" or "npz", format of the saved scenarios and IOTs, 
+        summary results are always saved to xlsx (see save_)
+    
+    profile = path of a JSON report of wall time, CPU time and peak memory
+        of each stage, written at the end of the run (see profiler)
+    
     """
     
-    def __init__(self, method):        
+    def __init__(self, method, workers = 1, blas_threads = None, fmt = "xlsx", profile = None):        
+        if profile is not None:
+            profiler.enable(profile)
+        
         self.method = method # 0 or 1
         self.directory = "outputs/"
+        self.fmt = fmt
+        self.workers = workers
+        self.blas_threads = blas_threads
         self.init_res = Results(method)
         
     def run_one_scenario(self, scen_no, results_only = True):
@@ -60,7 +79,7 @@ class Start:
         """
         Output all results in a table
         """
-        results_table = self.init_res.table_res()
+        results_table = self.init_res.table_res(True, self.workers, self.blas_threads)
 
         return(results_table)
     
@@ -69,7 +88,7 @@ class Start:
         """
         Output all results in a table
         """
-        init_save = Save(self.directory, self.method)
+        init_save = Save(self.directory, self.method, self.fmt)
         scenario = self.init_res.one_scen(scen_no, results_only)
         init_save.save_(scenario, scen_no)
     
@@ -79,8 +98,8 @@ class Start:
         Save all results in separate files and sheets
         data e.g. all_results.all_tables
         """
-        init_save = Save(self.directory, self.method)
-        data = self.init_res.table_res(False)
+        init_save = Save(self.directory, self.method, self.fmt)
+        data = self.init_res.table_res(False, self.workers, self.blas_threads)
         init_save.save_everything(data)
                 
 
@@ -88,8 +107,8 @@ class Start:
         """
         Save results
         """
-        init_save = Save(self.directory, self.method)
-        data = self.init_res.table_res()
+        init_save = Save(self.directory, self.method, self.fmt)
+        data = self.init_res.table_res(True, self.workers, self.blas_threads)
         init_save.save_results(data)
     
     def save_everything(self):
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Description: Compact on-disk store of the SUT matrices, one .npy file of
+             contiguous float values per matrix plus a separate label table,
+             opened with memory mapping the first time a matrix is requested
+"""
+import os
+import pickle as pk
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+import profiler
+
+label_table = "labels.pkl"
+
+
+@profiler.timed("convert SUT", "pkl")
+def convert(pkl, directory):
+    """
+    One-time conversion of a pickled dictionary of matrices into a store
+    """
+    data = pk.load(open(pkl, "rb"))
+
+    write(data, directory)
+
+
+def write(data, directory, dtype = np.float64, append = False):
+    """
+    Writes a dictionary of matrices as a store
+    
+    dtype = type of the stored values, None keeps that of each matrix
+    append = True, the matrices are added to those already in the store,
+             each file is written aside and moved in place so that readers
+             only ever see complete files
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok = True)
+
+    labels = {}
+    path = os.path.join(directory, label_table)
+    if append and os.path.exists(path):
+        with open(path, "rb") as f:
+            labels = pk.load(f)
+
+    for key, M in data.items():
+        if isinstance(M, pd.DataFrame):
+            kind, index, columns = "DataFrame", M.index, M.columns
+        elif isinstance(M, pd.Series):
+            kind, index, columns = "Series", M.index, None
+        elif isinstance(M, np.ndarray):
+            kind, index, columns = "ndarray", None, None
+        else:
+            labels[key] = ("object", M, None)
+            continue
+
+        try:
+            values = np.ascontiguousarray(M, dtype = dtype)
+        except (TypeError, ValueError):
+            labels[key] = ("object", M, None)
+            continue
+
+        if values.dtype.hasobject:
+            labels[key] = ("object", M, None)
+            continue
+
+        npy = os.path.join(directory, str(key) + ".npy")
+        if append:
+            tmp = npy + "." + str(os.getpid()) + ".npy"
+            np.save(tmp, values)
+            os.replace(tmp, npy)
+        else:
+            np.save(npy, values)
+        labels[key] = (kind, index, columns)
+
+    # written last, the label table marks a complete store
+    tmp = path + "." + str(os.getpid())
+    with open(tmp, "wb") as f:
+        pk.dump(labels, f)
+    os.replace(tmp, path)
+
+
+def regions(SUT):
+    """
+    Regions of a SUT in the order of its region blocks (level reg of Y)
+    """
+    index = SUT["Y"].index
+    level = "reg" if "reg" in index.names else 1
+    
+    return(list(pd.unique(index.get_level_values(level))))
+
+
+class Store(Mapping):
+    """
+    Read-only mapping of the matrices in a store, nothing is read before
+    the first access and each matrix is memory-mapped when requested
+
+    directory = store directory
+    source = pickle converted into the store when this is missing or older
+    mmap_mode = "c" copy-on-write, changes stay in memory, never on disk
+    """
+    def __init__(self, directory, source = None, mmap_mode = "c"):
+        self.directory = directory
+        self.source = source
+        self.mmap_mode = mmap_mode
+        self._labels = None
+        self.loaded = {}
+
+    def outdated(self):
+        """
+        True if the store is missing or older than its source
+        """
+        path = os.path.join(self.directory, label_table)
+
+        if not os.path.exists(path):
+            return(True)
+
+        if self.source is not None and os.path.exists(self.source):
+            return(os.path.getmtime(self.source) > os.path.getmtime(path))
+
+        return(False)
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            if self.outdated():
+                if self.source is None or not os.path.exists(self.source):
+                    raise FileNotFoundError("No store in " + self.directory + " and no pickle to convert")
+                convert(self.source, self.directory)
+
+            with open(os.path.join(self.directory, label_table), "rb") as f:
+                self._labels = pk.load(f)
+
+        return(self._labels)
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            kind, index, columns = self.labels[key]
+
+            if kind == "object":
+                M = index
+            else:
+                with profiler.stage("load SUT", matrix = key):
+                    path = os.path.join(self.directory, str(key) + ".npy")
+                    M = np.load(path, mmap_mode = self.mmap_mode)
+
+                    if kind == "DataFrame":
+                        M = pd.DataFrame(M, index = index, columns = columns, copy = False)
+                    elif kind == "Series":
+                        M = pd.Series(M, index = index, copy = False)
+
+            self.loaded[key] = M
+
+        return(self.loaded[key])
+
+    def __iter__(self):
+        return(iter(self.labels))
+
+    def __len__(self):
+        return(len(self.labels))
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Description: Parameter sweeps of a scenario, every combination of penetration
+             and technical coefficient values is evaluated in batches on the
+             baseline factorization and the results are returned in one table
+"""
+import itertools
+import numpy as np
+import pandas as pd
+import scen_plan
+import profiler
+
+
+class Sweep:
+    """
+    Parameter sweep of the interventions of a scenario
+
+    gr = GatherResults (baseline, scenario plan and analyse sheet)
+    scen_no = swept scenario e.g. 1 or "scenario_1"
+
+    params in run:
+        {column: values}, all the interventions of the scenario that set
+            the column (life, share, recycle, l_kp, s_kp, r_kp, fx_kp,
+            expansion) take each of the values
+        {(identifier, column): values}, only the intervention with that
+            identifier takes them
+    """
+
+    def __init__(self, gr, scen_no):
+        if type(scen_no) is int:
+            scen_no = "scenario_" + str(scen_no)
+
+        self.gr = gr
+        self.bns = gr.bns
+        self.scen = scen_no
+
+        plan = gr.plan
+        if scen_no not in plan.sheets:
+            raise KeyError(scen_no + " is not in " + plan.file + " - possible scenarios " + str(plan.sheets))
+
+        self.policies = {M_name: plan.select_(scen_no, M_name) for M_name in plan.matrices(scen_no)}
+
+    def combinations(self, params):
+        """
+        Names of the swept parameters and all their combinations
+        """
+        keys = list(params)
+        identifiers = set()
+        for rows in self.policies.values():
+            identifiers.update(rows["identifier"])
+
+        names = []
+        for key in keys:
+            col = key[1] if type(key) == tuple else key
+
+            if col not in scen_plan.Scen_plan.num_cols:
+                raise KeyError("Only the following parameters can be swept =>" + str(scen_plan.Scen_plan.num_cols))
+
+            if type(key) == tuple:
+                if key[0] not in identifiers:
+                    raise KeyError("No intervention with identifier " + str(key[0]) + " in " + self.scen)
+                names.append(str(key[0]) + ", " + col)
+            else:
+                names.append(col)
+
+        combos = list(itertools.product(*[list(params[k]) for k in keys]))
+
+        return(keys, names, combos)
+
+    def policies_(self, keys, values):
+        """
+        Interventions of the scenario with one combination of values
+        """
+        policies = {}
+        for M_name, rows in self.policies.items():
+            rows = rows.copy()
+            for key, v in zip(keys, values):
+                if type(key) == tuple:
+                    ident, col = key
+                    select = rows["identifier"] == ident
+                else:
+                    col = key
+                    select = rows[col].notnull()
+                rows.loc[select, col] = v
+            policies[M_name] = rows
+
+        return(policies)
+
+    def apply_(self, policies):
+        """
+        apply(M, M_name) for Base_n_scen.policies_
+        """
+        def apply(M, M_name):
+            if M_name in policies:
+                return(self.bns.ap.vect_new(policies[M_name], M))
+            return(M)
+
+        return(apply)
+
+    @profiler.timed("sweep")
+    def run(self, params, batch = 64):
+        """
+        Results (see scenarios.xls analyse) of every combination of params,
+        one row per combination indexed by the parameter values
+
+        batch = combinations solved together, their final demands are
+                stacked and solved at once on the baseline factors with
+                the changes of A as a low-rank update (leontief.solve_many)
+        """
+        keys, names, combos = self.combinations(params)
+        base = self.gr.base
+        L0 = self.bns.base_leontief(base)
+
+        rows = []
+        for b in range(0, len(combos), batch):
+            chunk = combos[b:b + batch]
+            Ms = [self.bns.policies_(self.scen, base, self.apply_(self.policies_(keys, values))) for values in chunk]
+
+            with profiler.stage("leontief"):
+                Y = np.column_stack([np.sum(M["Y"], axis = 1) for M in Ms])
+                Q = L0.solve_many([M["A"] for M in Ms], Y)
+
+            for c, values in enumerate(chunk):
+                IOT = self.bns.build_(self.scen, Ms[c], Q[:, c])
+                res = self.gr.iter_thru_for_results(IOT, self.scen).iloc[:, 0]
+                row = dict(zip(names, values))
+                row.update(res)
+                rows.append(row)
+
+        table = pd.DataFrame(rows)
+        if len(names) > 0:
+            table = table.set_index(names)
+
+        return(table)
@@ -0,0 +1,40 @@
+import os
+import sys
+import shutil
+import tempfile
+import pytest
+
+# the modules are flat at the top of the repository
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+
+import synthetic
+
+# a small synthetic case (see benchmarks/synthetic.py), dirs is pointed
+# at it before any module reading it is imported
+spec = {"n_prod": 20, "n_ind": 16, "n_fd": 7, "n_E": 19, "n_Be": 10, "n_Bm": 10, "n_Br": 5, "regions": ["EU", "ROW"]}
+case = tempfile.mkdtemp()
+paths = synthetic.write_case(case, **spec)
+
+import dirs
+from sut_store import Store
+
+dirs.SUT = Store(os.path.splitext(paths["SUT"])[0], paths["SUT"])
+dirs.BP = dirs.SUT
+dirs.index = paths["index"]
+dirs.scen_file = paths["scen_file"]
+dirs.base_cache = None
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(case, ignore_errors = True)
+
+
+@pytest.fixture
+def scenario_tables():
+    """
+    Scenario and analyse sheets of the synthetic case
+    """
+    SUT, t = synthetic.mrsut(**spec)
+    return(synthetic.scenario_tables(t, spec["regions"], SUT))
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+from SUTops import SUTops as sops
+
+
+def system_(n = 300, seed = 0):
+    rng = np.random.default_rng(seed)
+    A = rng.uniform(0, 1, (n, n)) * (rng.random((n, n)) < 0.1)
+    A *= 0.7 / A.sum(axis = 0).max() # column sums below 1
+    
+    return(A, rng.uniform(1, 10, n))
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_leontief_float32_refined_against_float64(sparse):
+    A, y = system_()
+    L = sops.leontief(sops.sparse(A) if sparse else A, np.float32, tol = 1e-12)
+    
+    q = L.solve(y)
+    assert L.residual <= 1e-12
+    assert sops.residual(A, y, q) <= 1e-12
+    assert np.allclose(q, np.linalg.solve(np.identity(len(y)) - A, y), rtol = 1e-10, atol = 0)
+    
+    m = L.solve_T(y)
+    assert sops.residual(A.T, y, m) <= 1e-12
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("changed", ["rows", "cols"])
+def test_leontief_update_and_solve_many(sparse, changed):
+    A, y = system_()
+    A_ = A.copy()
+    if changed == "rows":
+        A_[[3, 17]] *= 0.9
+    else:
+        A_[:, [3, 17, 40]] *= 1.1
+    q_ = np.linalg.solve(np.identity(len(y)) - A_, y)
+    
+    L = sops.leontief(sops.sparse(A) if sparse else A)
+    dA, rows, cols = L.diff_(sops.sparse(A_) if sparse else A_, 1e-12)
+    assert min(len(rows), len(cols)) <= 3
+    
+    L_ = L.update(sops.sparse(A_) if sparse else A_)
+    assert isinstance(L_, sops.woodbury)
+    assert np.allclose(L_.solve(y), q_, rtol = 1e-10, atol = 0)
+    
+    Q = L.solve_many([A, A_], np.column_stack([y, y]))
+    assert np.allclose(Q[:, 0], L.solve(y), rtol = 1e-12, atol = 0)
+    assert np.allclose(Q[:, 1], q_, rtol = 1e-10, atol = 0)
+
+
+def mixed_(n = 40, m = 30, seed = 0):
+    """
+    Matrix with negative entries and the totals of a matrix with the same signs
+    """
+    rng = np.random.default_rng(seed)
+    X0 = rng.uniform(1, 10, (n, m)) * (rng.random((n, m)) < 0.5)
+    X0[rng.random((n, m)) < 0.2] *= -1
+    X = X0 * rng.uniform(0.8, 1.25, (n, m))
+    
+    return(X0, X.sum(axis = 1), X.sum(axis = 0))
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_gras_mixed_signs(sparse):
+    X0, u, v = mixed_()
+    
+    g = sops.gras(sops.sparse(X0) if sparse else X0, u, v, tol = 1e-12, max_iter = 10000)
+    X = g.X.toarray() if sparse else g.X
+    assert g.converged and g.iterations > 1
+    assert g.residual <= 1e-9
+    assert np.allclose(X.sum(axis = 1), u, rtol = 0, atol = 1e-8)
+    assert np.allclose(X.sum(axis = 0), v, rtol = 0, atol = 1e-8)
+    assert np.array_equal(np.sign(X), np.sign(X0)) # signs and zeros are kept
+
+
+def test_gras_infeasible_targets():
+    X0, u, v = mixed_()
+    
+    with pytest.raises(ValueError, match = "sum to"):
+        sops.gras(X0, u, v * 1.1)
+    
+    X0[:, 3] = 0 # empty column with a total
+    with pytest.raises(ValueError, match = "empty columns"):
+        sops.gras(X0, u, v)
+    
+    with pytest.raises(ValueError, match = "shape"):
+        sops.gras(X0, u[1:], v)
+
+
+@pytest.mark.parametrize("method", ["gmres", "bicgstab", "series"])
+@pytest.mark.parametrize("preconditioned", [False, True])
+def test_iterative_matches_direct(method, preconditioned):
+    A, y = system_()
+    L = sops.leontief(A)
+    # the baseline system preconditions a changed one
+    A_ = A.copy()
+    A_[:, [3, 17, 40]] *= 1.1
+    
+    it = sops.iterative(A_, method, tol = 1e-12, M = L if preconditioned else None)
+    direct = sops.leontief(A_)
+    assert np.allclose(it.solve(y), direct.solve(y), rtol = 1e-9, atol = 0)
+    assert it.residual <= 1e-10
+    assert np.allclose(it.solve_T(y), direct.solve_T(y), rtol = 1e-9, atol = 0)
+    
+    # warm start from the baseline solution
+    warm = sops.iterative(A_, method, tol = 1e-12, M = L if preconditioned else None, x0 = L.solve(y))
+    assert np.allclose(warm.solve(y), direct.solve(y), rtol = 1e-9, atol = 0)
+
+
+@pytest.mark.parametrize("method", ["gmres", "bicgstab", "series"])
+def test_iterative_not_converged(method):
+    A, y = system_()
+    
+    it = sops.iterative(A, method, tol = 1e-14, max_iter = 2)
+    with pytest.warns(UserWarning, match = "did not converge"):
+        it.solve(y)
+    assert it.residual > 1e-14
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+from apply_policy import Apply_policy
+
+N = np.nan
+cols = ["intervention", "catA", "reg_A1", "stageA", "reg_A2", "catB", "reg_B1", "stageB", "reg_B2",
+        "life", "l_kp", "share", "s_kp", "recycle", "r_kp", "expansion", "fx_kp"]
+
+
+def matrix_():
+    labels = pd.MultiIndex.from_product([["EU", "ROW"], ["C_a", "C_b", "C_c"]], names = ["reg", "abb"])
+    labels = labels.swaplevel()
+    values = np.arange(1.0, 37.0).reshape(6, 6)
+    
+    return(pd.DataFrame(values, index = labels, columns = labels))
+
+
+def policies_():
+    rows = [
+        # overlapping interventions, each applies on the values left by the previous
+        ["direct", "C_a", "EU", "C_b", "EU", N, N, N, N, 20, 50, 10, 40, N, N, N, N],
+        ["indirect", "C_a", "EU", "C_b", "EU", "C_c", "EU", "C_b", "EU", 30, 50, N, N, N, N, N, 80],
+        ["expansion", "C_b", "ROW", N, N, N, N, N, N, N, N, N, N, N, N, 15, N],
+        # NaN region selectors
+        ["direct", "C_a", N, N, "ROW", N, N, N, N, 10, 100, N, N, 20, 50, N, N],
+        ["direct", N, "EU", "C_a", N, N, N, N, N, N, N, 25, 60, N, N, N, N],
+        ["expansion", "C_a", "EU", "C_b", "EU", N, N, N, N, N, N, N, N, N, N, -10, N]]
+    
+    return(pd.DataFrame(rows, columns = cols))
+
+
+def cells_(M, cat, reg1, stage, reg2):
+    """
+    Cells of M selected by a policy, by matching labels one by one
+    """
+    match = lambda l, c, r: (pd.isnull(c) or l[0] == c) and (pd.isnull(r) or l[1] == r)
+    
+    return([(i, j) for i, r in enumerate(M.index) if match(r, cat, reg1)
+            for j, c in enumerate(M.columns) if match(c, stage, reg2)])
+
+
+def element_wise(policies, M):
+    """
+    Policies applied cell by cell in the order of the scenario sheet
+    """
+    M = np.array(M.values, dtype = float)
+    
+    for l, p in policies.iterrows():
+        if p["intervention"] == "expansion":
+            k = [[p["expansion"], None]]
+        else:
+            k = [[kt, kp] for kt, kp in [[p["life"], p["l_kp"]], [p["share"], p["s_kp"]],
+                                         [p["recycle"], p["r_kp"]]] if pd.isnull(kt) == False]
+        A = cells_(matrix_(), p["catA"], p["reg_A1"], p["stageA"], p["reg_A2"])
+        
+        for kt, kp in k:
+            if p["intervention"] == "expansion":
+                for i, j in A:
+                    M[i, j] *= 1 + kt * 1e-2
+            elif p["intervention"] == "direct":
+                for i, j in A:
+                    M[i, j] *= 1 - kt * 1e-2 * kp * 1e-2
+            else:
+                B = cells_(matrix_(), p["catB"], p["reg_B1"], p["stageB"], p["reg_B2"])
+                for (i, j), (ib, jb) in zip(A, B):
+                    M[ib, jb] += M[i, j] * kt * 1e-2 * kp * 1e-2 * p["fx_kp"] * 1e-2
+    
+    return(M)
+
+
+@pytest.fixture
+def ap():
+    return(Apply_policy(["EU", "ROW"]))
+
+
+def test_vect_new_matches_element_wise(ap):
+    M, policies = matrix_(), policies_()
+    expected = element_wise(policies, M)
+    
+    M_ = ap.vect_new(policies, M)
+    assert np.allclose(M_.values, expected, rtol = 1e-14, atol = 0)
+    assert np.array_equal(M.values, matrix_().values) # M is not changed
+    
+    # the sequential engine gives the same matrix
+    assert np.allclose(ap.make_new(policies, M.copy(), "S").values, expected, rtol = 1e-14, atol = 0)
+
+
+def test_vect_new_order_dependent(ap):
+    M, policies = matrix_(), policies_()
+    
+    reordered = policies.iloc[::-1].reset_index(drop = True)
+    assert np.allclose(ap.vect_new(reordered, M).values, element_wise(reordered, M), rtol = 1e-14, atol = 0)
+    assert not np.allclose(ap.vect_new(reordered, M).values, ap.vect_new(policies, M).values)
+
+
+def test_column_region_without_row_region(ap):
+    """
+    catA without reg_A1 and a reg_A2: catA in every region, in the 
+    columns of reg_A2 only
+    """
+    M = matrix_()
+    policies = pd.DataFrame([["direct", "C_a", N, N, "ROW", N, N, N, N, 50, 100, N, N, N, N, N, N]], columns = cols)
+    
+    changed = ap.vect_new(policies, M).values != M.values
+    
+    rows = M.index.get_level_values("abb") == "C_a"
+    columns = M.columns.get_level_values("reg") == "ROW"
+    assert np.array_equal(changed, np.outer(rows, columns))
+    assert np.array_equal(ap.make_new(policies, M.copy(), "S").values != M.values, changed)
+    
+    # the shared label resolver gives the same rows and columns
+    res = ap.res
+    assert np.array_equal(np.arange(6)[res.positions(M.index, "C_a")], np.flatnonzero(rows))
+    assert np.array_equal(np.arange(6)[res.positions(M.columns, "ROW")], np.flatnonzero(columns))
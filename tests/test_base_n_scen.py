@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+from base_n_scen import Base_n_scen
+
+
+@pytest.fixture(scope = "module")
+def bns():
+    return(Base_n_scen())
+
+
+@pytest.mark.parametrize("scen", ["baseline", 1])
+def test_footprints_level(bns, scen):
+    F = bns.footprints(scen, "Be")
+    F_reg = bns.footprints(scen, "Be", level = "reg")
+
+    assert list(F_reg.columns) == list(F.columns.get_level_values("reg").unique())
+    assert list(F_reg.index) == list(F.index)
+    for r in F_reg.columns:
+        cols = F.columns.get_level_values("reg") == r
+        assert np.allclose(F_reg[r].values, F.loc[:, cols].sum(axis = 1).values)
+
+
+def test_cached_leontief_options(tmp_path, monkeypatch):
+    import base_n_scen
+    from base_cache import Cache
+    from SUTops import SUTops as sops
+    monkeypatch.setattr(base_n_scen, "base_cache", Cache(str(tmp_path)))
+    
+    warm = Base_n_scen()
+    assert isinstance(warm.base_leontief(warm.baseIOT()), sops.leontief)
+    
+    series = Base_n_scen(solver = "series", precondition = False)
+    assert series.base is not None # the baseline IOT is still shared
+    assert isinstance(series.base_leontief(series.baseIOT()), sops.iterative)
+    
+    gmres = Base_n_scen(solver = "gmres", tol = 1e-8)
+    assert gmres.L_key != warm.L_key
+
+
+def test_scenario_caches_follow_the_plan(tmp_path, monkeypatch, scenario_tables):
+    import os
+    import base_n_scen
+    import apply_policy
+    import synthetic
+    scenarios, analyse = scenario_tables
+    path = str(tmp_path / "scenarios.xlsx")
+    synthetic.write_scenarios(path, scenarios, analyse)
+    monkeypatch.setattr(base_n_scen, "scen_file", path)
+    monkeypatch.setattr(apply_policy, "scen_file", path)
+    
+    bns = Base_n_scen()
+    M = bns.multipliers(1)
+    bns.sceneIOT(1) # kept as the last scenario system
+    
+    # scenario 1 edited into scenario 3
+    scenarios["scenario_1"] = scenarios["scenario_3"]
+    synthetic.write_scenarios(path, scenarios, analyse)
+    os.utime(path, (0, os.stat(path).st_mtime + 10))
+    
+    M_ = bns.multipliers(1)
+    assert not np.allclose(M_.values, M.values)
+    assert np.allclose(M_.values, Base_n_scen().multipliers(3).values)
+    assert np.allclose(bns.footprints(1).values, bns.footprints(3).values)
+    assert np.allclose(bns.content("C_002", 1).values, bns.content("C_002", 3).values)
+
+
+def test_cached_baseline_is_lazy(tmp_path, monkeypatch):
+    import os
+    import base_n_scen
+    from base_cache import Cache
+    from SUTops import SUTops as sops
+    cache = Cache(str(tmp_path))
+    monkeypatch.setattr(base_n_scen, "base_cache", cache)
+    
+    def inv(self):
+        raise AssertionError("L evaluated")
+    
+    with monkeypatch.context() as m:
+        m.setattr(sops.leontief, "inv", inv)
+        cold = Base_n_scen()
+        base = cold.baseIOT()
+        S, A = base["S"], base["A"]
+    
+    assert not base.computed("L") and not base.computed("Be")
+    stored = os.listdir(str(tmp_path / cold.key))
+    assert "L.npy" not in stored and "Be.npy" not in stored
+    assert {"S.npy", "A.npy", "lu.npy", "piv.npy"} <= set(stored)
+    
+    warm = Base_n_scen()
+    base_ = warm.baseIOT()
+    assert warm.SUTs is None # the cached tables and factors need no transform
+    assert np.array_equal(base_["S"].values, S.values)
+    assert np.allclose(base_["L"].values, base["L"].values, rtol = 1e-12, atol = 0)
+    assert warm.SUTs is None
+    
+    assert np.allclose(base_["Be"].values, base["Be"].values) # missing, transformed
+    assert warm.SUTs is not None
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_balanced_scenario(sparse):
+    bns = Base_n_scen(sparse = sparse, balance = True)
+    bns.sceneIOT(1)
+    
+    b = bns.balanced[1]
+    assert b["converged"] and b["residual"] <= 1e-8 and b["iterations"] >= 1
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from labels import Resolver
+
+
+def index_(dtype = "string"):
+    regs = ["EU"] * 3 + ["ROW"] * 3
+    cats = ["C_a", "C_b", "C_c"] * 2
+    return(pd.MultiIndex.from_arrays([pd.Index(regs, dtype = dtype), pd.Index(cats, dtype = dtype)],
+                                     names = ["region", "code"]))
+
+
+def test_resolver_string_dtype():
+    index = index_()
+    res = Resolver(["EU", "ROW"])
+
+    assert res.levels(index) == (1, 0)
+    assert res.lookup(index)["blocks"] is not None
+    assert res.positions(index, "ROW") == slice(3, 6)
+    assert res.positions(index, ("C_b", "ROW")) == slice(4, 5)
+    assert list(res.positions(index, "C_c")) == [2, 5]
+
+
+def test_resolver_string_dtype_unblocked():
+    index = index_()[[0, 3, 1, 4, 5]]
+    res = Resolver(["EU", "ROW"])
+
+    assert res.lookup(index)["blocks"] is None
+    assert list(res.positions(index, "ROW")) == [1, 3, 4]
+    assert list(res.positions(index, ("C_b", "EU"))) == [2]
+    assert np.array_equal(res.positions(index, "C_a"), [0, 1])
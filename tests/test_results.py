@@ -0,0 +1,50 @@
+import numpy as np
+import sys
+import pytest
+from results import Results
+
+
+def test_parallel_scenarios_need_threadpoolctl(monkeypatch):
+    monkeypatch.setitem(sys.modules, "threadpoolctl", None) # import fails
+    res = Results(0)
+    
+    with pytest.raises(ImportError, match = "threadpoolctl"):
+        res.table_res(workers = 2)
+    
+    assert res.table_res(workers = 1) is not None # sequential runs need nothing
+
+
+def test_sweep_point_matches_scenario(monkeypatch):
+    from apply_policy import Apply_policy
+    from sweep import Sweep
+    res = Results(0)
+    params = {(1, "l_kp"): [0, 50], (4, "l_kp"): [100, 60]}
+    table = res.sweep(1, params, batch = 3)
+    
+    assert len(table) == 4
+    # the values of the scenario file give the scenario results
+    assert np.allclose(table.loc[(50, 100)].values, res.one_scen(1).iloc[:, 0].values, rtol = 1e-10)
+    
+    # any other point is the scenario with those values in the file
+    sw = Sweep(res.gr, 1)
+    policies = sw.policies_(list(params), (0, 60))
+    select_ = Apply_policy.select_
+    monkeypatch.setattr(Apply_policy, "select_", lambda self, sheet, M_name: policies[M_name] if M_name in policies else select_(self, sheet, M_name))
+    single = Results(0).one_scen(1).iloc[:, 0]
+    assert np.allclose(table.loc[(0, 60)].values, single.values, rtol = 1e-10)
+    assert not np.allclose(table.loc[(0, 60)].values, table.loc[(50, 100)].values)
+
+
+def test_final_demand_scenarios_batched():
+    res = Results(0)
+    bns = res.gr.bns
+    assert bns.y_only(2) and not bns.y_only(1)
+    
+    batched = bns.y_onlyIOT([2, 2], res.gr.base)
+    single = bns.sceneIOT(2, res.gr.base)
+    for IOT in batched:
+        for k in ["S", "Y", "Be", "YBe", "E"]:
+            assert np.allclose(np.asarray(IOT[k]), np.asarray(single[k]), rtol = 1e-12, atol = 0), k
+    
+    table = res.table_res()
+    assert np.allclose(table.loc["sc_2"].values, res.one_scen(2).iloc[:, 0].values, rtol = 1e-12)
@@ -0,0 +1,39 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import save_
+from save_ import Save
+
+
+def tables_():
+    rows = pd.MultiIndex.from_tuples([("C_a", "EU"), ("C_b", "EU"), ("C_a", "ROW")], names = ["abb", "reg"])
+    cols = pd.MultiIndex.from_tuples([("F_a", "EU"), ("F_a", "ROW")], names = ["abb", "reg"])
+    
+    return({"Y": pd.DataFrame(np.arange(6.0).reshape(3, 2) / 7, index = rows, columns = cols),
+            "q": pd.DataFrame({"q": [1.5, 2.5, 3.5]}, index = rows)})
+
+
+def test_npz_round_trip(tmp_path):
+    save = Save(str(tmp_path) + "/", 0, "npz")
+    data = tables_()
+    save.save_(data, "scenario_1")
+    
+    tables = save_.load_(os.path.join(save.directory, "scenario_1.npz"))
+    for l, M in data.items():
+        pd.testing.assert_frame_equal(tables[l], M)
+    assert tables["general_specs"].loc["Scenario no", "General_info"] == "scenario_1"
+
+
+@pytest.mark.parametrize("fmt", Save.formats)
+def test_summary_results_xlsx(tmp_path, fmt):
+    save = Save(str(tmp_path) + "/", 0, fmt)
+    results = tables_()["Y"]
+    save.save_results(results)
+    
+    file = os.path.join(save.directory, "summary_results.xlsx")
+    assert pd.ExcelFile(file).sheet_names == ["general_specs", "results"]
+    
+    table = pd.read_excel(file, sheet_name = "results", index_col = [0, 1], header = [0, 1])
+    assert np.allclose(table.values, results.values)
+    assert list(table.index) == list(results.index)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+import spa
+from base_n_scen import Base_n_scen
+
+
+@pytest.fixture(scope = "module")
+def base():
+    bns = Base_n_scen()
+    return(bns, bns.baseIOT())
+
+
+@pytest.fixture(scope = "module")
+def spa_(base):
+    bns, IOT = base
+    return(spa.SPA(IOT, "Be", IOT["Be"].index[0][0], bns.base_leontief(IOT), bns.regions))
+
+
+def test_paths_sum_to_footprint(spa_):
+    """
+    Unpruned paths up to depth d are r * (I + A + ... + A^d) * y, the 
+    footprint r * L * y less the remainder r * A^(d+1) * L * y
+    """
+    d = 2
+    P = spa_.paths(threshold = 0, depth = d, max_paths = 10**7)
+    
+    A, L = spa_.A.toarray(), np.linalg.inv(np.identity(len(spa_.y)) - spa_.A.toarray())
+    total = spa_.r @ L @ spa_.y
+    remainder = spa_.r @ np.linalg.matrix_power(A, d + 1) @ L @ spa_.y
+    assert np.isclose(P.attrs["total"], total, rtol = 1e-10)
+    assert np.isclose(P["value"].sum(), total - remainder, rtol = 1e-10)
+    for k in range(d + 1):
+        assert np.isclose(P.loc[P["depth"] == k, "value"].sum(), spa_.r @ np.linalg.matrix_power(A, k) @ spa_.y, rtol = 1e-10)
+    
+    # the upstream footprints of the final products add up to the total
+    assert np.isclose(P.loc[P["depth"] == 0, "upstream"].sum(), total, rtol = 1e-10)
+
+
+def test_pruning_threshold(spa_):
+    """
+    With nonnegative A and r a path is never below its extensions, so
+    pruning keeps exactly the paths at or above the threshold
+    """
+    d, threshold = 3, 0.002
+    full = spa_.paths(threshold = 0, depth = d, max_paths = 10**7)
+    pruned = spa_.paths(threshold = threshold, depth = d, max_paths = 10**7)
+    
+    cut = threshold * abs(full.attrs["total"])
+    kept = full[full["value"].abs() >= cut]
+    assert len(pruned) < len(full) and (pruned["value"].abs() >= cut).all()
+    assert sorted(pruned["path"]) == sorted(kept["path"])
+    assert np.isclose(pruned["value"].sum(), kept["value"].sum(), rtol = 1e-12)
+    
+    assert len(spa_.paths(threshold = threshold, depth = d, max_paths = 5)) == 5